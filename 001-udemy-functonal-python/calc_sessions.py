@@ -0,0 +1,192 @@
+import asyncio
+from collections import deque
+
+# The calculator of the final example keeps every input in a list:
+#
+#     def process_input():
+#         state = []
+#         while True:
+#             update = yield
+#             state.append(update)
+#             if can_calculate(state):
+#                 result = calculate(state)
+#                 state.append(result)
+#
+# and can_calculate/calculate unpack it with `*_, i1, op, i2 = state`, which
+# copies the whole list on every input. A session gets slower and bigger the
+# longer it lives.
+#
+# Only the last three tokens ever matter, so here the state is a
+# deque(maxlen=3): appending pushes the oldest token out, and a session has
+# the same small, constant size however many tokens it has seen.
+#
+# serve() puts one such session behind every TCP connection. A client sends
+# one token per line and gets one line back per token:
+#   '= <result>' when the token completed a calculation
+#   '.'          when it was accepted
+#   '? <reason>' when it was neither a number nor an operator, or the line
+#                was longer than LINE_LIMIT (the line is skipped)
+# Bytes that are not UTF-8 are read as U+FFFD, so they give '? ...' as well.
+# 'exit' or 'quit' ends the session. All sessions share one event loop.
+
+OPERATORS = '+', '-', '/', '*'
+EXIT_COMMANDS = 'exit', 'quit'
+LINE_LIMIT = 1 << 10
+
+
+def can_calculate(state):
+
+    if len(state) < 3:
+        return False
+    i1, op, i2 = state
+    return isinstance(i1, float) and op in OPERATORS and isinstance(i2, float)
+
+
+def calculate(state):
+
+    i1, op, i2 = state
+    if op == '+':
+        return i1 + i2
+    elif op == '-':
+        return i1 - i2
+    elif op == '/':
+        return i1 / i2
+    elif op == '*':
+        return i1 * i2
+
+
+def validate_input(i):
+
+    try:
+        return float(i)
+    except ValueError:
+        pass
+    if i in OPERATORS or i in EXIT_COMMANDS:
+        return i
+    return None
+
+
+def process_input():
+    # send a token, get back the result it completed or None
+
+    state = deque(maxlen=3)
+    result = None
+    while True:
+        update = yield result
+        result = None
+        state.append(update)
+        if can_calculate(state):
+            result = calculate(state)
+            state.append(result)
+
+
+async def read_line(reader):
+    # the next line, b'' at the end, or None for a line over the reader's
+    # limit, which is read up to its newline and thrown away
+    try:
+        return await reader.readuntil(b'\n')
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError as e:
+        consumed = e.consumed
+    while True:
+        await reader.readexactly(consumed)
+        try:
+            await reader.readuntil(b'\n')
+            return None
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+
+async def handle_session(reader, writer):
+    session = process_input()
+    session.send(None)
+    try:
+        while True:
+            line = await read_line(reader)
+            if line == b'':
+                break
+            i = None if line is None else validate_input(line.decode(errors='replace').strip())
+            if line is None:
+                reply = '? Line too long'
+            elif i is None:
+                reply = '? Please enter a number or an operator'
+            elif i in EXIT_COMMANDS:
+                break
+            else:
+                try:
+                    result = session.send(i)
+                except ZeroDivisionError:
+                    # the error ended the generator, start the session over
+                    session = process_input()
+                    session.send(None)
+                    reply = '? division by zero'
+                else:
+                    reply = '.' if result is None else '= %r' % result
+            writer.write(reply.encode() + b'\n')
+            await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(host='127.0.0.1', port=0):
+    return await asyncio.start_server(handle_session, host, port, limit=LINE_LIMIT)
+
+
+# A stand-in for many clients: each one opens a connection, sends its tokens
+# one at a time and waits for every reply.
+async def client(port, tokens, latencies):
+    # latencies[k] collects the reply times of the k-th token of every session
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    loop = asyncio.get_running_loop()
+    replies = []
+    for k, token in enumerate(tokens):
+        t0 = loop.time()
+        writer.write(token.encode() + b'\n')
+        replies.append((await reader.readline()).decode().strip())
+        latencies[k].append(loop.time() - t0)
+    writer.write(b'exit\n')
+    writer.close()
+    await writer.wait_closed()
+    return replies
+
+async def load_test(sessions=500, tokens=200):
+    server = await serve()
+    port = server.sockets[0].getsockname()[1]
+    script = ['1'] + ['+', '1'] * (tokens // 2)
+    latencies = [[] for _ in script]
+    t0 = asyncio.get_running_loop().time()
+    results = await asyncio.gather(*(client(port, script, latencies) for _ in range(sessions)))
+    elapsed = asyncio.get_running_loop().time() - t0
+    server.close()
+    await server.wait_closed()
+    assert all(r[-1] == '= %r' % float(tokens // 2 + 1) for r in results)
+    mean = lambda ks: 1000 * sum(sum(latencies[k]) for k in ks) / (sessions * len(ks))
+    print('%d sessions x %d tokens: %.0f tokens/s' % (sessions, len(script), sessions * len(script) / elapsed))
+    print('mean latency of tokens 1-10: %.2f ms, of the last 10 tokens: %.2f ms'
+          % (mean(range(10)), mean(range(len(script) - 10, len(script)))))
+
+
+if __name__ == '__main__':
+    session = process_input()
+    session.send(None)
+    for token in (1.0, '+', 2.0, '*', 4.0):
+        result = session.send(token)
+        if result is not None:
+            print('result: %f' % result)
+
+    async def bad_input():
+        server = await serve()
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'1\n\xff\xfe\n' + b'9' * (5 * LINE_LIMIT) + b'\n+\n2\n')
+        replies = [(await reader.readline()).decode().strip() for _ in range(5)]
+        writer.write(b'exit\n')
+        assert await reader.read() == b''
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        assert replies == ['.', '? Please enter a number or an operator', '? Line too long', '.', '= 3.0'], replies
+    asyncio.run(bad_input())
+
+    asyncio.run(load_test())
@@ -1,3 +1,8 @@
+from array import array
+
+from hamt import PersistentMap
+from memory import bytes_per_instance
+
 # By using OOP we can mirror the code into how we think about the world
 # If we think about voting we thing about Voter and Politician
 
@@ -50,3 +55,132 @@ def votes(politicians, politician):
 voters, politicians = vote({}, {}, 'Jean', 'Macron')
 print(voted_for(voters, 'Jean'))
 print(votes(politicians, 'Macron'))
+
+# A purely functional approach
+# With persistent maps vote returns new states and never touches the old ones,
+# without copying the whole dicts (see hamt.py)
+def persistent_vote(voters, politicians, voter, politician):
+    return (voters.assoc(voter, politician),
+            politicians.assoc(politician, politicians.get(politician, 0) + 1))
+
+before = (PersistentMap(), PersistentMap())
+after = persistent_vote(*before, 'Jean', 'Macron')
+print(voted_for(after[0], 'Jean'), '/', voted_for(before[0], 'Jean'))
+print(votes(after[1], 'Macron'), '/', votes(before[1], 'Macron'))
+
+# A compact approach
+# Every Voter and Politician above carries its own __dict__ for two attributes.
+# With millions of instances the dicts take most of the memory.
+# __slots__ stores the attributes in fixed places in the instance instead.
+class SlotVoter:
+    __slots__ = ('name', 'voted_for')
+    def __init__(self, name):
+        self.name = name
+        self.voted_for = None
+    def vote(self, politician):
+        self.voted_for = politician
+        politician.votes += 1
+    def __str__(self):
+        return self.name
+
+class SlotPolitician:
+    __slots__ = ('name', 'votes')
+    def __init__(self, name):
+        self.name = name
+        self.votes = 0
+    def __str__(self):
+        return self.name
+
+# Struct of arrays: no object per voter at all. A voter is a row number, and
+# every attribute is a column of ids: an array('i') of name ids plus an
+# array('i') of politician row numbers (-1 for no vote yet). Names are
+# interned in a NameTable, so a name shared by many voters is stored once and
+# each voter holds 4 bytes for it. When every name is different, the dict of
+# the NameTable costs more than it saves; a PackedNames table then stores the
+# names one after the other in a single bytearray instead, with an array('q')
+# of where each one ends, and never shares one. The politicians table works
+# the same way, with its names interned and an array('q') of vote counts.
+class NameTable:
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+    def intern(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+    def __getitem__(self, i):
+        return self.names[i]
+    def __len__(self):
+        return len(self.names)
+
+class PackedNames:
+    # the NameTable interface, but intern() appends every name it is given
+    def __init__(self):
+        self.data = bytearray()
+        self.ends = array('q')
+    def intern(self, name):
+        self.data += name.encode()
+        self.ends.append(len(self.data))
+        return len(self.ends) - 1
+    def __getitem__(self, i):
+        return self.data[self.ends[i - 1] if i else 0:self.ends[i]].decode()
+    def __len__(self):
+        return len(self.ends)
+
+class PoliticianTable:
+    def __init__(self):
+        self.names = NameTable()
+        self.votes = array('q')
+    def add(self, name):
+        row = self.names.intern(name)
+        if row == len(self.votes):
+            self.votes.append(0)
+        return row
+
+class VoterTable:
+    def __init__(self, politicians, names=None):
+        # names may be shared with other tables
+        self.politicians = politicians
+        self.names = names if names is not None else NameTable()
+        self.name_ids = array('i')
+        self.voted = array('i')
+    def add(self, name):
+        self.name_ids.append(self.names.intern(name))
+        self.voted.append(-1)
+        return len(self.voted) - 1
+    def name(self, voter):
+        return self.names[self.name_ids[voter]]
+    def vote(self, voter, politician):
+        self.voted[voter] = politician
+        self.politicians.votes[politician] += 1
+    def voted_for(self, voter):
+        row = self.voted[voter]
+        return None if row < 0 else self.politicians.names[row]
+
+politicians_table = PoliticianTable()
+voters_table = VoterTable(politicians_table)
+jean_row = voters_table.add('Jean')
+voters_table.vote(jean_row, politicians_table.add('Macron'))
+print('%s voted for %s' % (voters_table.name(jean_row), voters_table.voted_for(jean_row)))
+
+
+def create_table(names, table_names=NameTable):
+    table = VoterTable(PoliticianTable(), table_names())
+    for name in names:
+        table.add(name)
+    return table
+
+if __name__ == '__main__':
+    packed = create_table(['Jean', 'Zoé', 'Jean'], PackedNames)
+    assert [packed.name(v) for v in range(3)] == ['Jean', 'Zoé', 'Jean']
+
+    for distinct in (None, 1000):
+        print('%s names:' % ('unique' if distinct is None else '%d different' % distinct))
+        print('  Voter:                    %.0f bytes per voter' % bytes_per_instance(lambda names: [Voter(n) for n in names], distinct=distinct))
+        print('  SlotVoter:                %.0f bytes per voter' % bytes_per_instance(lambda names: [SlotVoter(n) for n in names], distinct=distinct))
+        print('  VoterTable, NameTable:    %.0f bytes per voter' % bytes_per_instance(create_table, distinct=distinct))
+        print('  VoterTable, PackedNames:  %.0f bytes per voter' % bytes_per_instance(lambda names: create_table(names, PackedNames), distinct=distinct))
+    print('NameTable pays a dict entry per different name and wins when names repeat;')
+    print('PackedNames pays the encoded bytes of every name and wins when they are unique.')
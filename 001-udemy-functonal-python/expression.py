@@ -0,0 +1,276 @@
+import keyword
+import re
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# p_calculate, f_calculate and the functional calculate pick the operation
+# with an if/else chain on the operator string every time they are called,
+# and they only know `number1 operator number2`.
+#
+# compile_expression parses a whole arithmetic expression once, e.g.
+# '(price - cost) * 2 / units', with the usual precedence (* and / before
+# + and -, unary minus, parentheses). Names in the expression are variables.
+# The parse tree is turned into Python source for a function, here
+# `def expression(cost, price, units): return (price - cost) * 2 / units`,
+# and compiled, so evaluating it runs plain bytecode with no dispatch at all.
+# Parentheses are written only where precedence needs them, and very long
+# chains such as a + b + ... are split into assignments, so neither the
+# parser's nor the compiler's nesting limit is reached; nesting that is still
+# too deep (thousands of parentheses) raises ValueError.
+# Only trees produced by the parser are ever compiled, and without builtins.
+# Compiled expressions are cached by their source text.
+#
+# evaluate(text, columns) runs the expression over whole columns. With NumPy
+# the function is called once with arrays and the operators become ufuncs (a
+# division by zero gives inf instead of raising); otherwise it is mapped over
+# the rows. Only columns of all floats or all int64-sized ints become arrays.
+# int64 wraps around silently, so with int columns the expression is also
+# run in float64, and if the two disagree the rows are mapped over with
+# Python ints, as they are for any other column.
+
+OPERATORS = '+', '-', '*', '/'
+
+_TOKEN = re.compile(r'\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)|([A-Za-z_]\w*)|(.))')
+
+
+def tokenize(text):
+    tokens = []
+    for number, name, op in _TOKEN.findall(text.strip()):
+        if number:
+            value = float(number) if re.search('[.eE]', number) else int(number)
+            if value == float('inf'):
+                # repr() would write inf, which compiles to an unknown name
+                raise ValueError('Number out of range %r in %r' % (number, text))
+            tokens.append(('num', value))
+        elif name:
+            if keyword.iskeyword(name):
+                raise ValueError('Invalid name %r in %r' % (name, text))
+            tokens.append(('var', name))
+        elif op in OPERATORS or op in '()':
+            tokens.append((op, None))
+        else:
+            raise ValueError('Invalid character %r in %r' % (op, text))
+    return tokens
+
+
+class _Parser:
+    # expr   := term (('+' | '-') term)*
+    # term   := factor (('*' | '/') factor)*
+    # factor := '-' factor | '+' factor | number | name | '(' expr ')'
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        tree = self.expr()
+        if self.peek() is not None:
+            raise ValueError('Unexpected %r in %r' % (self.peek(), self.text))
+        return tree
+
+    def expr(self):
+        tree = self.term()
+        while self.peek() in ('+', '-'):
+            tree = (self.take()[0], tree, self.term())
+        return tree
+
+    def term(self):
+        tree = self.factor()
+        while self.peek() in ('*', '/'):
+            tree = (self.take()[0], tree, self.factor())
+        return tree
+
+    def factor(self):
+        kind = self.peek()
+        if kind is None:
+            raise ValueError('Unexpected end of %r' % self.text)
+        if kind in ('-', '+'):
+            self.take()
+            return ('neg', self.factor()) if kind == '-' else self.factor()
+        if kind in ('num', 'var'):
+            return self.take()
+        if kind == '(':
+            self.take()
+            tree = self.expr()
+            if self.peek() != ')':
+                raise ValueError('Missing ) in %r' % self.text)
+            self.take()
+            return tree
+        raise ValueError('Unexpected %r in %r' % (kind, self.text))
+
+
+def parse(text):
+    try:
+        return _Parser(text).parse()
+    except RecursionError:
+        raise ValueError('Expression nested too deeply: %.40r...' % text) from None
+
+# binding strength: + and - < * and / < unary minus < numbers and names
+CHAIN = 100
+_LEVEL = {'+': 1, '-': 1, '*': 2, '/': 2, 'neg': 3, 'num': 4, 'var': 4}
+
+def _source(tree, steps, level=0):
+    # Python source for tree, in parentheses only when it binds weaker than
+    # the level its place needs. A chain longer than CHAIN is cut into
+    # assignments appended to steps, `_t0 = a + ... ; _t1 = _t0 + ...`, which
+    # keeps its left-to-right order; the whole chain in one expression is
+    # nested too deeply for Python's compiler.
+    kind = tree[0]
+    if kind == 'num':
+        return repr(tree[1])
+    if kind == 'var':
+        return tree[1]
+    if kind == 'neg':
+        text = '-' + _source(tree[1], steps, 3)
+    else:
+        # a chain like a - b + c is nested to the left, walk it in a loop
+        own = _LEVEL[kind]
+        rights = []
+        while _LEVEL[tree[0]] == own:
+            rights.append((tree[0], tree[2]))
+            tree = tree[1]
+        text = _source(tree, steps, own)
+        for i, (op, right) in enumerate(reversed(rights), 1):
+            text += ' %s %s' % (op, _source(right, steps, own + 1))
+            if i % CHAIN == 0 and i < len(rights):
+                steps.append(text)
+                text = '%s%d' % (steps.prefix, len(steps) - 1)
+    return '(%s)' % text if _LEVEL[kind] < level else text
+
+class _Steps(list):
+    # assignments for the chunks of long chains, to names starting with a
+    # prefix that no variable starts with
+    def __init__(self, variables):
+        super().__init__()
+        self.prefix = '_t'
+        while any(v.startswith(self.prefix) for v in variables):
+            self.prefix += '_'
+
+def _variables(tree, found):
+    pending = [tree]
+    while pending:
+        tree = pending.pop()
+        if tree[0] == 'var':
+            found.add(tree[1])
+        pending += [child for child in tree[1:] if isinstance(child, tuple)]
+    return found
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(text):
+    tree = parse(text)
+    variables = tuple(sorted(_variables(tree, set())))
+    steps = _Steps(variables)
+    body = _source(tree, steps)
+    lines = ['def expression(%s):' % ', '.join(variables)]
+    lines += ['    %s%d = %s' % (steps.prefix, i, step) for i, step in enumerate(steps)]
+    lines += ['    return ' + body]
+    namespace = {'__builtins__': {}}
+    try:
+        exec('\n'.join(lines), namespace)
+    except (RecursionError, SyntaxError, MemoryError):
+        # nesting beyond what Python's compiler takes
+        raise ValueError('Expression nested too deeply: %.40r...' % text) from None
+    fn = namespace['expression']
+    fn.variables = variables
+    return fn
+
+def evaluate(text, columns=None, **values):
+    # columns maps every variable to a sequence of operands
+    fn = compile_expression(text)
+    columns = dict(columns or {}, **values)
+    args = [columns[v] for v in fn.variables]
+    if not args:
+        return fn()
+    arrays = [_column(a) for a in args] if np is not None else [None]
+    if None in arrays:
+        return list(map(fn, *args))
+    result = fn(*arrays)
+    if any(a.dtype.kind in 'iu' for a in arrays):
+        with np.errstate(all='ignore'):
+            exact = np.allclose(result, fn(*(a.astype(np.float64) for a in arrays)),
+                                rtol=1e-6, atol=0, equal_nan=True)
+        if not exact:
+            return list(map(fn, *(a.tolist() for a in arrays)))
+    return result
+
+def _column(values):
+    # values as an int64 or float64 array, or None when NumPy's arithmetic
+    # would differ from Python's
+    if isinstance(values, np.ndarray):
+        return values if values.dtype.kind in 'iuf' else None
+    types = set(map(type, values))
+    if types == {float}:
+        return np.array(values, dtype=np.float64)
+    if types == {int}:
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            return None
+    return None
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    def f_calculate(number1, operator, number2):
+        return number1 + number2 if operator == '+' \
+                else number1 - number2 if operator == '-' \
+                else number1 * number2 if operator == '*' \
+                else number1 / number2 if operator == '/' \
+                else None
+
+    print('Starting test')
+    assert evaluate('1 + 2 * 3') == 7
+    assert evaluate('(1 + 2) * 3') == 9
+    assert evaluate('-2 * -(3 - 5) / 4') == -1.0
+    assert evaluate('a - b - c', a=[10], b=[3], c=[2])[0] == 5
+    assert compile_expression('x*2') is compile_expression('x*2')
+    assert evaluate('a - (b - c) / (2 * -(d + 1))', a=[1], b=[2], c=[3], d=[4]) == [1 - (2 - 3) / (2 * -(4 + 1))]
+    for n in (250, 1200, 20_000):
+        assert evaluate('+'.join(['a'] * n), a=[1]) == [n]
+    # variables named like the temporaries of a long chain
+    chain = ' - '.join(['_t', '_t0'] * 150)
+    assert evaluate(chain, _t=[1], _t0=[2]) == [eval(chain, {'_t': 1, '_t0': 2})]
+    for deep in ('(' * 5000 + 'a' + ')' * 5000, '-' * 5000 + 'a'):
+        try:
+            compile_expression(deep)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('nesting')
+    assert list(evaluate('a * a', a=[2**40, 3])) == [2**80, 9]
+    assert list(evaluate('a * 2 + b', a=[2**62], b=[0.5])) == [2**63 + 0.5]
+    for bad in ('1 +', '(1 + 2', '1 + 2)', '2 ** 3', '__import__("os")', 'lambda + 1', '1e400', 'x * 1e999'):
+        try:
+            compile_expression(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(bad)
+    print('Done')
+
+    n = 500_000
+    a = [random.uniform(1, 100) for _ in range(n)]
+    b = [random.uniform(1, 100) for _ in range(n)]
+    t0 = time.perf_counter()
+    expected = [f_calculate(f_calculate(x, '+', y), '*', f_calculate(x, '-', y)) for x, y in zip(a, b)]
+    t1 = time.perf_counter()
+    result = evaluate('(a + b) * (a - b)', a=a, b=b)
+    t2 = time.perf_counter()
+    assert all(abs(x - y) < 1e-9 * max(1, abs(x)) for x, y in zip(result, expected))
+    print('f_calculate per row: %.0f ms, compiled expression: %.0f ms (%s)'
+          % (1000 * (t1 - t0), 1000 * (t2 - t1), 'numpy' if np is not None else 'map'))
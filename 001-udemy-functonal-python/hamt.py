@@ -0,0 +1,560 @@
+# election.vote is "not purely functional since we are resetting the values
+# for dicts". The pure alternative copies both dicts on every ballot, and a
+# copy of a 1M-entry dict costs milliseconds.
+#
+# PersistentMap and PersistentVector never change. assoc() returns a new
+# version and leaves the old one as it was, so every earlier state stays
+# valid. The two versions share all but a handful of nodes:
+# - A PersistentMap is a hash array mapped trie. Every node covers 5 bits of
+#   the key's hash, has up to 32 slots and a bitmap of the slots in use, and
+#   stores only those slots. get() follows at most log32(n) nodes, and
+#   assoc() copies only the nodes on that path (4-5 small lists for 1M keys).
+# - A PersistentVector is a 32-way trie of its elements by index, plus a tail
+#   list of the last (up to 32) elements, so append() is mostly a copy of
+#   the tail.
+# transient() gives a builder for many updates in a row. It copies a node
+# the first time it changes it and then changes its own copy in place.
+# persistent() ends the builder and returns the result as a persistent value.
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+HASH_BITS = 64
+
+_MISSING = object()
+
+
+class _Node:
+    # items holds a (key, value) tuple or a child node for every bit in bitmap
+    __slots__ = ('bitmap', 'items', 'owner')
+
+    def __init__(self, bitmap, items, owner=None):
+        self.bitmap = bitmap
+        self.items = items
+        self.owner = owner
+
+    def editable(self, owner):
+        if owner is not None and self.owner is owner:
+            return self
+        return _Node(self.bitmap, self.items[:], owner)
+
+
+class _Collision:
+    # keys whose 64-bit hashes are all equal
+    __slots__ = ('hash', 'items', 'owner')
+
+    def __init__(self, h, items, owner=None):
+        self.hash = h
+        self.items = items
+        self.owner = owner
+
+    def editable(self, owner):
+        if owner is not None and self.owner is owner:
+            return self
+        return _Collision(self.hash, self.items[:], owner)
+
+
+def _hash(key):
+    return hash(key) & ((1 << HASH_BITS) - 1)
+
+def _pair(shift, h1, item1, h2, item2, owner):
+    # the smallest subtree holding two entries
+    if shift >= HASH_BITS:
+        return _Collision(h1, [item1, item2], owner)
+    i1, i2 = (h1 >> shift) & MASK, (h2 >> shift) & MASK
+    if i1 == i2:
+        return _Node(1 << i1, [_pair(shift + BITS, h1, item1, h2, item2, owner)], owner)
+    return _Node((1 << i1) | (1 << i2), [item1, item2] if i1 < i2 else [item2, item1], owner)
+
+def _assoc(node, shift, h, key, value, owner):
+    # returns (node, added); node is the one given when nothing changed
+    if type(node) is _Collision:
+        for i, item in enumerate(node.items):
+            if item[0] == key:
+                if item[1] is value:
+                    return node, False
+                node = node.editable(owner)
+                node.items[i] = (key, value)
+                return node, False
+        node = node.editable(owner)
+        node.items.append((key, value))
+        return node, True
+
+    bit = 1 << ((h >> shift) & MASK)
+    pos = (node.bitmap & (bit - 1)).bit_count()
+    if not node.bitmap & bit:
+        node = node.editable(owner)
+        node.bitmap |= bit
+        node.items.insert(pos, (key, value))
+        return node, True
+
+    item = node.items[pos]
+    if type(item) is tuple:
+        if item[0] is key or item[0] == key:
+            if item[1] is value:
+                return node, False
+            new = (key, value)
+            added = False
+        else:
+            new = _pair(shift + BITS, _hash(item[0]), item, h, (key, value), owner)
+            added = True
+    else:
+        new, added = _assoc(item, shift + BITS, h, key, value, owner)
+        if new is item:
+            # unchanged, or a child the transient changed in place
+            return node, added
+    node = node.editable(owner)
+    node.items[pos] = new
+    return node, added
+
+def _dissoc(node, shift, h, key, owner):
+    # returns (node or None when it became empty, removed)
+    if type(node) is _Collision:
+        for i, item in enumerate(node.items):
+            if item[0] == key:
+                if len(node.items) == 1:
+                    return None, True
+                node = node.editable(owner)
+                del node.items[i]
+                return node, True
+        return node, False
+
+    bit = 1 << ((h >> shift) & MASK)
+    if not node.bitmap & bit:
+        return node, False
+    pos = (node.bitmap & (bit - 1)).bit_count()
+    item = node.items[pos]
+    if type(item) is tuple:
+        if not (item[0] is key or item[0] == key):
+            return node, False
+        new = None
+    else:
+        new, removed = _dissoc(item, shift + BITS, h, key, owner)
+        if not removed or new is item:
+            return node, removed
+    if new is None and node.bitmap == bit:
+        return None, True
+    node = node.editable(owner)
+    if new is None:
+        node.bitmap ^= bit
+        del node.items[pos]
+    else:
+        node.items[pos] = new
+    return node, True
+
+def _items(node):
+    for item in node.items:
+        if type(item) is tuple:
+            yield item
+        else:
+            yield from _items(item)
+
+
+class _MapBase:
+    __slots__ = ('root', 'count')
+
+    def get(self, key, default=None):
+        h = _hash(key)
+        node = self.root
+        shift = 0
+        while node is not None:
+            if type(node) is _Collision:
+                for k, v in node.items:
+                    if k == key:
+                        return v
+                return default
+            bit = 1 << ((h >> shift) & MASK)
+            if not node.bitmap & bit:
+                return default
+            node = node.items[(node.bitmap & (bit - 1)).bit_count()]
+            if type(node) is tuple:
+                return node[1] if node[0] is key or node[0] == key else default
+            shift += BITS
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return self.count
+
+    def items(self):
+        return _items(self.root) if self.root is not None else iter(())
+
+    def keys(self):
+        return (k for k, _ in self.items())
+
+    def values(self):
+        return (v for _, v in self.items())
+
+    __iter__ = keys
+
+
+class PersistentMap(_MapBase):
+    __slots__ = ()
+
+    def __init__(self, items=(), _root=None, _count=0):
+        self.root = _root
+        self.count = _count
+        if items:
+            built = self.transient().update(items).persistent()
+            self.root, self.count = built.root, built.count
+
+    def assoc(self, key, value):
+        h = _hash(key)
+        if self.root is None:
+            return PersistentMap(_root=_Node(1 << (h & MASK), [(key, value)]), _count=1)
+        root, added = _assoc(self.root, 0, h, key, value, None)
+        if root is self.root:
+            return self
+        return PersistentMap(_root=root, _count=self.count + added)
+
+    def dissoc(self, key):
+        if self.root is None:
+            return self
+        root, removed = _dissoc(self.root, 0, _hash(key), key, None)
+        if not removed:
+            return self
+        return PersistentMap(_root=root, _count=self.count - 1)
+
+    def transient(self):
+        return TransientMap(self.root, self.count)
+
+    def __eq__(self, other):
+        if not isinstance(other, (_MapBase, dict)):
+            return NotImplemented
+        return len(self) == len(other) and all(other.get(k, _MISSING) == v for k, v in self.items())
+
+    def __repr__(self):
+        return 'PersistentMap({%s})' % ', '.join('%r: %r' % kv for kv in self.items())
+
+
+class TransientMap(_MapBase):
+    __slots__ = ('owner',)
+
+    def __init__(self, root=None, count=0):
+        self.root = root
+        self.count = count
+        self.owner = object()
+
+    def _check(self):
+        if self.owner is None:
+            raise RuntimeError('Transient used after persistent()')
+
+    def assoc(self, key, value):
+        self._check()
+        h = _hash(key)
+        if self.root is None:
+            self.root = _Node(1 << (h & MASK), [(key, value)], self.owner)
+            self.count = 1
+        else:
+            self.root, added = _assoc(self.root, 0, h, key, value, self.owner)
+            self.count += added
+        return self
+
+    def dissoc(self, key):
+        self._check()
+        if self.root is not None:
+            self.root, removed = _dissoc(self.root, 0, _hash(key), key, self.owner)
+            self.count -= removed
+        return self
+
+    def update(self, items):
+        if hasattr(items, 'items'):
+            items = items.items()
+        assoc = self.assoc
+        for key, value in items:
+            assoc(key, value)
+        return self
+
+    def persistent(self):
+        self._check()
+        self.owner = None
+        return PersistentMap(_root=self.root, _count=self.count)
+
+
+class _VNode:
+    __slots__ = ('items', 'owner')
+
+    def __init__(self, items, owner=None):
+        self.items = items
+        self.owner = owner
+
+    def editable(self, owner):
+        if owner is not None and self.owner is owner:
+            return self
+        return _VNode(self.items[:], owner)
+
+
+_EMPTY_NODE = _VNode([])
+
+
+def _new_path(shift, node, owner):
+    while shift:
+        node = _VNode([node], owner)
+        shift -= BITS
+    return node
+
+def _push_tail(count, shift, parent, tail, owner):
+    # parent with the full tail node added at index count - 1
+    parent = parent.editable(owner)
+    i = ((count - 1) >> shift) & MASK
+    if shift == BITS:
+        new = tail
+    elif i < len(parent.items):
+        new = _push_tail(count, shift - BITS, parent.items[i], tail, owner)
+    else:
+        new = _new_path(shift - BITS, tail, owner)
+    if i < len(parent.items):
+        parent.items[i] = new
+    else:
+        parent.items.append(new)
+    return parent
+
+def _vassoc(shift, node, i, value, owner):
+    node = node.editable(owner)
+    if shift == 0:
+        node.items[i & MASK] = value
+    else:
+        j = (i >> shift) & MASK
+        node.items[j] = _vassoc(shift - BITS, node.items[j], i, value, owner)
+    return node
+
+
+class _VectorBase:
+    __slots__ = ('count', 'shift', 'root', 'tail')
+
+    def _tail_offset(self):
+        return 0 if self.count < WIDTH else ((self.count - 1) >> BITS) << BITS
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('index out of range')
+        if i >= self._tail_offset():
+            return self.tail[i & MASK]
+        node = self.root
+        for shift in range(self.shift, 0, -BITS):
+            node = node.items[(i >> shift) & MASK]
+        return node.items[i & MASK]
+
+    def get(self, i, default=None):
+        return self[i] if -self.count <= i < self.count else default
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        def leaves(node, shift):
+            if shift == 0:
+                yield node.items
+            else:
+                for child in node.items:
+                    yield from leaves(child, shift - BITS)
+        if self.count >= WIDTH:
+            for leaf in leaves(self.root, self.shift):
+                yield from leaf
+        yield from self.tail
+
+    def _append(self, value, owner):
+        # the new (count, shift, root, tail), changing nodes owned by owner
+        count, shift, root, tail = self.count, self.shift, self.root, self.tail
+        if count - self._tail_offset() < WIDTH:
+            if owner is not None:
+                tail.append(value)
+            else:
+                tail = tail + [value]
+            return count + 1, shift, root, tail
+        full = _VNode(tail, owner)
+        if (count >> BITS) > (1 << shift):
+            root = _VNode([root, _new_path(shift, full, owner)], owner)
+            shift += BITS
+        else:
+            root = _push_tail(count, shift, root, full, owner)
+        return count + 1, shift, root, [value]
+
+    def _assoc(self, i, value, owner):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('index out of range')
+        root, tail = self.root, self.tail
+        if i >= self._tail_offset():
+            if owner is None:
+                tail = tail[:]
+            tail[i & MASK] = value
+        else:
+            root = _vassoc(self.shift, root, i, value, owner)
+        return root, tail
+
+
+class PersistentVector(_VectorBase):
+    __slots__ = ()
+
+    def __init__(self, items=(), _state=None):
+        self.count, self.shift, self.root, self.tail = _state or (0, BITS, _EMPTY_NODE, [])
+        if items:
+            built = self.transient().extend(items).persistent()
+            self.count, self.shift, self.root, self.tail = built.count, built.shift, built.root, built.tail
+
+    def append(self, value):
+        return PersistentVector(_state=self._append(value, None))
+
+    def assoc(self, i, value):
+        if i == self.count:
+            return self.append(value)
+        root, tail = self._assoc(i, value, None)
+        return PersistentVector(_state=(self.count, self.shift, root, tail))
+
+    def transient(self):
+        return TransientVector(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, (_VectorBase, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return 'PersistentVector(%r)' % list(self)
+
+
+class TransientVector(_VectorBase):
+    __slots__ = ('owner',)
+
+    def __init__(self, vector):
+        # the tail is the only node a transient changes without copying first
+        self.count, self.shift, self.root = vector.count, vector.shift, vector.root
+        self.tail = vector.tail[:]
+        self.owner = object()
+
+    def _check(self):
+        if self.owner is None:
+            raise RuntimeError('Transient used after persistent()')
+
+    def append(self, value):
+        self._check()
+        self.count, self.shift, self.root, self.tail = self._append(value, self.owner)
+        return self
+
+    def extend(self, values):
+        append = self.append
+        for value in values:
+            append(value)
+        return self
+
+    def assoc(self, i, value):
+        self._check()
+        if i == self.count:
+            return self.append(value)
+        self.root, self.tail = self._assoc(i, value, self.owner)
+        return self
+
+    def persistent(self):
+        self._check()
+        self.owner = None
+        return PersistentVector(_state=(self.count, self.shift, self.root, self.tail))
+
+
+def benchmark(n=1_000_000, ballots=1000):
+    import random
+    import time
+
+    def timed(f, *args):
+        t0 = time.perf_counter()
+        result = f(*args)
+        return result, time.perf_counter() - t0
+
+    rnd = random.Random(1)
+    politicians = ['Macron', 'Le Pen', 'Melenchon', 'Fillon']
+    state = {'voter%d' % i: rnd.choice(politicians) for i in range(n)}
+    votes = [('new%d' % i, rnd.choice(politicians)) for i in range(ballots)]
+
+    pmap, build = timed(PersistentMap, state)
+    print('%d entries, PersistentMap built through a transient in %.2f s' % (n, build))
+
+    def mutate(d):
+        for voter, politician in votes:
+            d[voter] = politician
+        return d
+
+    def copy_each(d, k):
+        for voter, politician in votes[:k]:
+            d = dict(d)
+            d[voter] = politician
+        return d
+
+    def persistent(m):
+        for voter, politician in votes:
+            m = m.assoc(voter, politician)
+        return m
+
+    copies = 20
+    _, t_mutate = timed(mutate, dict(state))
+    _, t_copy = timed(copy_each, state, copies)
+    new, t_assoc = timed(persistent, pmap)
+    assert len(new) == n + ballots and len(pmap) == n and 'new0' not in pmap
+    print('per vote: dict mutation %.2f us, dict copy %.0f us, PersistentMap.assoc %.2f us'
+          % (1e6 * t_mutate / ballots, 1e6 * t_copy / copies, 1e6 * t_assoc / ballots))
+
+    keys = rnd.sample(list(state), 100_000)
+    _, t_dict = timed(lambda: [state[k] for k in keys])
+    _, t_get = timed(lambda: [pmap.get(k) for k in keys])
+    print('per get: dict %.2f us, PersistentMap %.2f us' % (1e6 * t_dict / len(keys), 1e6 * t_get / len(keys)))
+
+    vector, build = timed(PersistentVector, range(n))
+    _, t_append = timed(lambda: [vector.append(i) for i in range(ballots)])
+    _, t_vassoc = timed(lambda: [vector.assoc(i * 997, -1) for i in range(ballots)])
+    _, t_list = timed(lambda: [list(range(n)) for _ in range(5)])
+    print('PersistentVector of %d built in %.2f s; append %.2f us, assoc %.2f us, list copy %.0f us'
+          % (n, build, 1e6 * t_append / ballots, 1e6 * t_vassoc / ballots, 1e6 * t_list / 5))
+
+
+if __name__ == '__main__':
+    print('Starting test')
+    m = PersistentMap()
+    m1 = m.assoc('a', 1)
+    m2 = m1.assoc('b', 2).assoc('a', 3)
+    assert len(m) == 0 and m1['a'] == 1 and m2['a'] == 3 and m2['b'] == 2 and 'b' not in m1
+    assert m2.dissoc('a') == {'b': 2} and m2 == {'a': 3, 'b': 2}
+
+    class Clash:
+        # equal hashes for different keys go to a collision node
+        def __init__(self, n):
+            self.n = n
+        def __hash__(self):
+            return 42
+        def __eq__(self, other):
+            return isinstance(other, Clash) and other.n == self.n
+
+    keys = list(range(5000)) + [Clash(i) for i in range(10)]
+    reference, versions = {}, [PersistentMap()]
+    for i, k in enumerate(keys):
+        reference[k] = i
+        versions.append(versions[-1].assoc(k, i))
+    assert versions[-1] == reference and versions[100] == dict(zip(keys[:100], range(100)))
+    t = versions[-1].transient()
+    for k in keys[::2]:
+        t.dissoc(k)
+    smaller = t.persistent()
+    assert len(smaller) == len(keys) // 2 and all(smaller.get(k) == reference[k] for k in keys[1::2])
+    assert versions[-1] == reference
+
+    v = PersistentVector(range(3000))
+    w = v.assoc(5, 'x').assoc(2999, 'y').append('z')
+    assert list(v) == list(range(3000)) and w[5] == 'x' and w[2999] == 'y' and w[-1] == 'z'
+    assert len(w) == 3001 and v[5] == 5
+    t = PersistentVector().transient()
+    for i in range(40_000):
+        t.append(i)
+    u = t.persistent()
+    assert list(u) == list(range(40_000)) and u[33_333] == 33_333
+    print('Done')
+
+    benchmark()
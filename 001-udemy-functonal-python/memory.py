@@ -0,0 +1,13 @@
+import tracemalloc
+
+
+def bytes_per_instance(create, n=100_000, distinct=None):
+    # memory allocated by create(names), per name; the names exist beforehand.
+    # With distinct, the n names repeat a pool of that many different names.
+    names = ['name%d' % (i % (distinct or n)) for i in range(n)]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = create(names)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(stat.size_diff for stat in after.compare_to(before, 'filename')) / n
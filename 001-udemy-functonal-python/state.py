@@ -1,3 +1,5 @@
+from memory import bytes_per_instance
+
 current_speaker = None
 
 # A stateful example
@@ -27,6 +29,16 @@ john.speak('Hello World')
 carlos = Speaker('Carlos')
 carlos.speak('Foobar!')
 
+# The same class without a per-instance __dict__: _name lives in a slot
+class SlotSpeaker():
+    __slots__ = ('_name',)
+    def __init__(self, name):
+        self._name = name
+    def speak(self, text):
+        print('[%s] %s' % (self._name, text))
+
+SlotSpeaker('John').speak('Hello World')
+
 
 # Stateless implementation of the above examples
 def speak(speaker, text):
@@ -34,3 +46,7 @@ def speak(speaker, text):
 
 speak('John', 'Hello world')
 speak('Carlos', 'Foobar!')
+
+if __name__ == '__main__':
+    print('Speaker:     %.0f bytes per speaker' % bytes_per_instance(lambda names: [Speaker(n) for n in names]))
+    print('SlotSpeaker: %.0f bytes per speaker' % bytes_per_instance(lambda names: [SlotSpeaker(n) for n in names]))
@@ -0,0 +1,246 @@
+from array import array
+from collections import Counter
+from itertools import islice
+import zlib
+
+# election.vote counts one ballot at a time in two dicts:
+#
+#     voters[voter] = politician
+#     politicians[politician] += 1
+#
+# Tally counts whole batches of (voter, politician) ballots instead.
+# - Politician names are interned: each name gets a small integer id the first
+#   time it shows up, and the counts live in an array('q') indexed by that id.
+# - Every voter counts once; later ballots of the same voter are ignored.
+#   Voters are remembered in a set, or, when they are numbered 0..voters-1,
+#   in a bitmap of voters/8 bytes (12.5 MB for 100M voters).
+# - With names, a batch is deduplicated with dict/set operations and counted
+#   with one Counter() call, all of which run in C. Numbered voters are
+#   tested against the bitmap in a plain loop (np.unique on the object array
+#   of names was slower than that), and an id outside 0..voters-1 raises
+#   ValueError.
+# - merge() adds up tallies of different shards. The shards have to split the
+#   voters between them (shard_of), then the merged result is exact. Both
+#   tallies have to count voters the same way, by name or by number.
+# - parallel_tally starts one worker process per shard and streams the
+#   ballots to them: it reads BATCH_SIZE ballots at a time, splits the batch
+#   by shard (partition) and puts each part on the queue of its worker, so
+#   every ballot is sent once, to one worker, and at most QUEUE_DEPTH batches
+#   per shard are in flight. The ballots are never all in memory at once.
+
+BATCH_SIZE = 1 << 14
+QUEUE_DEPTH = 4
+
+
+def shard_of(voter, shards):
+    # crc32 rather than hash(), which differs between processes for strings
+    return (voter if isinstance(voter, int) else zlib.crc32(str(voter).encode())) % shards
+
+
+class Tally:
+    def __init__(self, voters=None):
+        self.names = []
+        self.ids = {}
+        self.counts = array('q')
+        self.voters = voters
+        self.bitmap = bytearray((voters + 7) // 8) if voters is not None else None
+        self.seen = set() if voters is None else None
+
+    def _intern(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.counts.append(0)
+        return i
+
+    def _add(self, counter):
+        for name, n in counter.items():
+            self.counts[self._intern(name)] += n
+
+    def ingest(self, ballots, batch_size=BATCH_SIZE):
+        it = iter(ballots)
+        while True:
+            batch = list(islice(it, batch_size))
+            if not batch:
+                return self
+            if self.bitmap is None:
+                self._ingest_names(batch)
+            else:
+                self._ingest_bitmap(batch)
+
+    def _ingest_names(self, batch):
+        # reversed, so the dict keeps the first ballot of a voter in the batch
+        first = dict(reversed(batch))
+        for voter in first.keys() & self.seen:
+            del first[voter]
+        self.seen.update(first)
+        self._add(Counter(first.values()))
+
+    def _ingest_bitmap(self, batch):
+        bitmap, voters = self.bitmap, self.voters
+        accepted = []
+        for voter, politician in batch:
+            if not 0 <= voter < voters:
+                raise ValueError('voter %r is not in range(%d)' % (voter, voters))
+            byte, bit = voter >> 3, 1 << (voter & 7)
+            if not bitmap[byte] & bit:
+                bitmap[byte] |= bit
+                accepted.append(politician)
+        self._add(Counter(accepted))
+
+    def merge(self, other):
+        if self.voters != other.voters:
+            raise ValueError("can't merge a tally of %s voters with one of %s voters"
+                             % (_mode(self), _mode(other)))
+        for name, n in zip(other.names, other.counts):
+            self.counts[self._intern(name)] += n
+        if self.bitmap is not None:
+            merged = int.from_bytes(self.bitmap, 'little') | int.from_bytes(other.bitmap, 'little')
+            self.bitmap[:] = merged.to_bytes(len(self.bitmap), 'little')
+        else:
+            self.seen |= other.seen
+        return self
+
+    def votes(self, politician):
+        i = self.ids.get(politician)
+        return 0 if i is None else self.counts[i]
+
+    def results(self):
+        return dict(zip(self.names, self.counts))
+
+
+def _mode(tally):
+    return 'named' if tally.voters is None else '%d numbered' % tally.voters
+
+def partition(ballots, shards):
+    # one list of ballots per shard, in input order
+    parts = [[] for _ in range(shards)]
+    appends = [part.append for part in parts]
+    for ballot in ballots:
+        voter = ballot[0]
+        appends[voter % shards if type(voter) is int else shard_of(voter, shards)](ballot)
+    return parts
+
+def _tally_shard(queue, results, shard, voters):
+    # tallies the batches on queue up to a None, then puts (shard, tally) or
+    # (shard, exception) on results. After an exception the rest of the queue
+    # is read and dropped, so the parent never blocks on a full queue.
+    try:
+        tally = Tally(voters)
+        for batch in iter(queue.get, None):
+            tally.ingest(batch)
+        results.put((shard, tally))
+    except Exception as e:
+        results.put((shard, e))
+        for _ in iter(queue.get, None):
+            pass
+
+def parallel_tally(ballots, shards, voters=None, batch_size=BATCH_SIZE):
+    import multiprocessing
+    queues = [multiprocessing.Queue(QUEUE_DEPTH) for _ in range(shards)]
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_tally_shard, args=(queue, results, shard, voters), daemon=True)
+               for shard, queue in enumerate(queues)]
+    for worker in workers:
+        worker.start()
+    try:
+        it = iter(ballots)
+        while True:
+            batch = list(islice(it, batch_size))
+            if not batch:
+                break
+            for queue, part in zip(queues, partition(batch, shards)):
+                if part:
+                    queue.put(part)
+        for queue in queues:
+            queue.put(None)
+        tallies = [None] * shards
+        for _ in workers:
+            shard, tally = results.get()
+            if isinstance(tally, Exception):
+                raise tally
+            tallies[shard] = tally
+        for worker in workers:
+            worker.join()
+        return _merge_all(tallies)
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+def _merge_all(tallies):
+    tallies = iter(tallies)
+    total = next(tallies)
+    for t in tallies:
+        total.merge(t)
+    return total
+
+
+POLITICIANS = ['Macron', 'Le Pen', 'Melenchon', 'Fillon']
+
+def random_ballots(n=1_000_000, voters=800_000, seed=1):
+    import random
+    rnd = random.Random(seed)
+    return [(rnd.randrange(voters), rnd.choice(POLITICIANS)) for _ in range(n)]
+
+
+if __name__ == '__main__':
+    import os
+    import time
+
+    def vote(voters, politicians, voter, politician):
+        voters[voter] = politician
+        if politician in politicians:
+            politicians[politician] += 1
+        else:
+            politicians[politician] = 1
+        return (voters, politicians)
+
+    ballots = random_ballots()
+
+    # election.vote, but skipping voters who already voted
+    t0 = time.perf_counter()
+    voters, politicians = {}, {}
+    for voter, politician in ballots:
+        if voter not in voters:
+            vote(voters, politicians, voter, politician)
+    t1 = time.perf_counter()
+    by_name = Tally().ingest(ballots)
+    t2 = time.perf_counter()
+    by_bitmap = Tally(voters=800_000).ingest(ballots)
+    t3 = time.perf_counter()
+    assert by_name.results() == by_bitmap.results() == politicians
+    print('vote() loop: %.0f ms, Tally: %.0f ms, Tally with bitmap: %.0f ms'
+          % (1000 * (t1 - t0), 1000 * (t2 - t1), 1000 * (t3 - t2)))
+
+    sample = random_ballots(200_000, 150_000)
+    expected = Tally().ingest(sample).results()
+    assert parallel_tally(sample, 4, voters=150_000).results() == expected
+    assert parallel_tally(iter(sample), 3).results() == expected
+    names = [('voter %d' % v, p) for v, p in sample]
+    assert parallel_tally(names, 4).results() == expected
+    print(expected)
+    for bad in ([(-1, 'Macron')], [(150_000, 'Macron')]):
+        try:
+            Tally(voters=150_000).ingest(bad)
+        except ValueError as e:
+            print(e)
+        else:
+            raise AssertionError(bad)
+    try:
+        parallel_tally(sample + [(-1, 'Macron')] + sample, 2, voters=150_000)
+    except ValueError as e:
+        print(e)
+    else:
+        raise AssertionError('negative voter in a shard')
+    try:
+        Tally().merge(Tally(voters=8))
+    except ValueError as e:
+        print(e)
+    else:
+        raise AssertionError('merged named and numbered voters')
+
+    t0 = time.perf_counter()
+    parallel_tally(ballots, 4)
+    print('parallel_tally, 4 shards on %d CPUs: %.0f ms' % (os.cpu_count(), 1000 * (time.perf_counter() - t0)))
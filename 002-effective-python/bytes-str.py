@@ -14,7 +14,7 @@ def to_str(bytes_or_str):
 def to_bytes(bytes_or_str):
     if isinstance(bytes_or_str, str):
         value = bytes_or_str.encode('utf-8')
-    else
+    else:
         value = bytes_or_str
     return value # Instance of bytes
 
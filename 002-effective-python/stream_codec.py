@@ -0,0 +1,171 @@
+import codecs
+
+# to_str and to_bytes in bytes-str.py convert a whole object at once. For a
+# large file that means the bytes and the str are in memory side by side, and
+# decoding chunk by chunk with them breaks as soon as a multi-byte character
+# (é is b'\xc3\xa9' in UTF-8) is split between two chunks.
+#
+# The helpers here convert iterators of chunks instead, with the incremental
+# codecs, which keep an unfinished character until the next chunk arrives:
+#   iter_str(chunks)   bytes-like chunks -> str chunks (str chunks pass
+#                      through)
+#   iter_bytes(chunks) str chunks -> bytes chunks (bytes chunks pass through)
+#   read_str(f)        str chunks of a binary file, read into one reused
+#                      bytearray with readinto(), so memory stays at one chunk
+#                      and no bytes object is made per chunk
+#   write_str(f, chunks) encodes chunks into one reused bytearray and writes
+#                      it whenever it is full
+# ASCII fast path: for encodings that agree with ASCII, a small chunk (a line,
+# a field) that is pure ASCII and has no unfinished character before it is
+# converted with the 'ascii' codec and never reaches the incremental codec,
+# whose decode() is Python code and costs more than the conversion itself.
+# str.isascii() only reads a flag; bytes.isascii() scans the chunk, so large
+# chunks skip the check and go straight to the codec, whose UTF-8 decoder
+# copies ASCII runs word by word anyway.
+
+CHUNK_SIZE = 1 << 16
+FAST_PATH_LIMIT = 1 << 12
+
+_ASCII_COMPATIBLE = {codecs.lookup(name).name for name in
+                     ('ascii', 'utf-8', 'latin-1', 'iso8859-15', 'cp1252')}
+
+
+def _ascii_compatible(encoding):
+    return codecs.lookup(encoding).name in _ASCII_COMPATIBLE
+
+
+def iter_str(chunks, encoding='utf-8', errors='strict'):
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    fast = _ascii_compatible(encoding)
+    pending = False
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            yield chunk
+        elif fast and not pending and len(chunk) < FAST_PATH_LIMIT and \
+                (chunk if isinstance(chunk, (bytes, bytearray)) else bytes(chunk)).isascii():
+            # memoryview and other buffers have no isascii(), small ones are copied
+            yield str(chunk, 'ascii')
+        else:
+            value = decoder.decode(chunk)
+            pending = bool(decoder.getstate()[0])
+            if value:
+                yield value
+    value = decoder.decode(b'', True)
+    if value:
+        yield value
+
+def iter_bytes(chunks, encoding='utf-8', errors='strict'):
+    encoder = codecs.getincrementalencoder(encoding)(errors)
+    fast = _ascii_compatible(encoding)
+    for chunk in chunks:
+        if not isinstance(chunk, str):
+            yield chunk
+        elif fast and chunk.isascii():
+            yield chunk.encode('ascii')
+        else:
+            value = encoder.encode(chunk)
+            if value:
+                yield value
+    value = encoder.encode('', True)
+    if value:
+        yield value
+
+
+def read_str(f, encoding='utf-8', errors='strict', size=CHUNK_SIZE):
+    # f is a file opened with 'rb'
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    while True:
+        n = f.readinto(buffer)
+        if not n:
+            break
+        value = decoder.decode(view[:n])
+        if value:
+            yield value
+    value = decoder.decode(b'', True)
+    if value:
+        yield value
+
+def write_str(f, chunks, encoding='utf-8', errors='strict', size=CHUNK_SIZE):
+    # f is a file opened with 'wb'; returns the number of bytes written
+    buffer = bytearray()
+    written = 0
+    for value in iter_bytes(chunks, encoding, errors):
+        buffer += value
+        if len(buffer) >= size:
+            written += f.write(buffer)
+            del buffer[:]
+    if buffer:
+        written += f.write(buffer)
+    return written
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import tempfile
+    import time
+    import tracemalloc
+
+    def to_str(bytes_or_str):
+        if isinstance(bytes_or_str, bytes):
+            value = bytes_or_str.decode('utf-8')
+        else:
+            value = bytes_or_str
+        return value # Intance of str
+
+    print('Starting test')
+    text = 'héllo wörld, 1 € = ∞ 🐍 ' * 50
+    data = text.encode('utf-8')
+    for size in (1, 2, 3, 7, 64):
+        pieces = [data[i:i + size] for i in range(0, len(data), size)]
+        assert ''.join(iter_str(pieces)) == text
+        assert b''.join(iter_bytes(text[i:i + size] for i in range(0, len(text), size))) == data
+    utf16 = text.encode('utf-16')
+    assert ''.join(iter_str((utf16[i:i + 5] for i in range(0, len(utf16), 5)), 'utf-16')) == text
+    assert ''.join(iter_str([b'caf\xc3', b'\xa9 ', 'ok'])) == 'café ok'
+    assert ''.join(iter_str([memoryview(b'abc'), bytearray(b'd\xc3'), memoryview(b'\xa9')])) == 'abcdé'
+    try:
+        list(iter_str([b'abc\xc3']))
+    except UnicodeDecodeError:
+        pass
+    else:
+        raise AssertionError('unfinished character at the end')
+    print('Done')
+
+    def plain(chunks):
+        # an incremental decoder on every chunk, without the fast path
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        return sum(len(decoder.decode(chunk)) for chunk in chunks) + len(decoder.decode(b'', True))
+
+    def blocks(f):
+        return iter(lambda: f.read(CHUNK_SIZE), b'')
+
+    def measure(name, path, read):
+        # timed without tracemalloc, which slows every allocation down
+        t0 = time.perf_counter()
+        with open(path, 'rb') as f:
+            n = read(f)
+        elapsed = time.perf_counter() - t0
+        tracemalloc.start()
+        with open(path, 'rb') as f:
+            read(f)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('%-34s %d chars in %.0f ms, peak %.1f MB' % (name, n, 1000 * elapsed, peak / 2**20))
+
+    for kind, share in (('ascii', 0), ('mixed', 0.01)):
+        lines = ['ligne %d: déjà vu €\n' % i if random.random() < share else 'line %d, plain ascii text\n' % i
+                 for i in range(2_000_000)]
+        with tempfile.NamedTemporaryFile('wb', delete=False) as f:
+            written = write_str(f, lines)
+            path = f.name
+        assert written == os.path.getsize(path)
+
+        measure(kind + ', to_str(f.read())', path, lambda f: len(to_str(f.read())))
+        measure(kind + ', blocks, incremental decoder', path, lambda f: plain(blocks(f)))
+        measure(kind + ', blocks, read_str', path, lambda f: sum(map(len, read_str(f))))
+        measure(kind + ', lines, incremental decoder', path, plain)
+        measure(kind + ', lines, iter_str', path, lambda f: sum(map(len, iter_str(f))))
+        os.remove(path)
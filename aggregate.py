@@ -0,0 +1,202 @@
+from collections import Counter
+from itertools import islice
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# consume_generator in generators.py counts the styles with a dict and then
+# walks the dict again for the most popular one:
+#
+#     for bd in beerdicts:
+#         if bd['Style'] not in beer_counts:
+#             beer_counts[bd['Style']] = 1
+#         else:
+#             beer_counts[bd['Style']] +=1
+#
+# GroupBy does the same kind of work for count, sum, mean, min and max of a
+# value per key. Records are pulled from the iterator in batches of
+# `batch_size`, and each batch is turned into two columns (keys and values)
+# with map() and an itemgetter before anything is counted:
+# - counts are a single Counter.update() per batch
+# - with NumPy the keys of a batch are numbered in order of appearance (any
+#   hashable key, tuples and mixed types included), a value column of only
+#   floats or only ints becomes an array of that type, np.bincount sums the
+#   groups and np.minimum.at / np.maximum.at reduce them. Results keep the
+#   type of the values: int sums that could lose precision, and any other
+#   values, take the plain loop below.
+# - without NumPy one loop over zip(keys, values) updates sum/min/max
+#
+# A GroupBy only holds per-group totals, so two of them, e.g. built over
+# different chunks of a file in different processes, combine exactly with
+# merge(). mean() and top() are computed from the totals at the end.
+
+BATCH_SIZE = 8192
+
+
+class GroupBy:
+    def __init__(self, key, value=None, batch_size=BATCH_SIZE):
+        # key and value are column positions/names or functions of a record
+        self.key = key if callable(key) else itemgetter(key)
+        self.value = value if value is None or callable(value) else itemgetter(value)
+        self.batch_size = batch_size
+        self.counts = Counter()
+        self.sums = {}
+        self.mins = {}
+        self.maxs = {}
+
+    def update(self, records):
+        it = iter(records)
+        while True:
+            batch = list(islice(it, self.batch_size))
+            if not batch:
+                return self
+            keys = list(map(self.key, batch))
+            self.counts.update(keys)
+            if self.value is not None:
+                values = list(map(self.value, batch))
+                if np is not None:
+                    self._reduce_numpy(keys, values)
+                else:
+                    self._reduce(keys, values)
+
+    def _reduce(self, keys, values):
+        sums, mins, maxs = self.sums, self.mins, self.maxs
+        for k, v in zip(keys, values):
+            if k in sums:
+                sums[k] += v
+                if v < mins[k]:
+                    mins[k] = v
+                if v > maxs[k]:
+                    maxs[k] = v
+            else:
+                sums[k] = mins[k] = maxs[k] = v
+
+    def _reduce_numpy(self, keys, values):
+        types = set(map(type, values))
+        if types == {float}:
+            array = np.array(values, dtype=np.float64)
+        elif types == {int} and max(max(values), -min(values)) * len(values) < 2**53:
+            # bincount sums in float64, which is exact up to 2**53
+            array = np.array(values, dtype=np.int64)
+        else:
+            return self._reduce(keys, values)
+        groups = list(dict.fromkeys(keys))
+        ids = {k: i for i, k in enumerate(groups)}
+        index = np.fromiter(map(ids.__getitem__, keys), dtype=np.intp, count=len(keys))
+        sums = np.bincount(index, weights=array, minlength=len(groups)).astype(array.dtype)
+        mins = np.full(len(groups), array.max(), dtype=array.dtype)
+        maxs = np.full(len(groups), array.min(), dtype=array.dtype)
+        np.minimum.at(mins, index, array)
+        np.maximum.at(maxs, index, array)
+        self._combine(zip(groups, sums.tolist(), mins.tolist(), maxs.tolist()))
+
+    def _combine(self, partials):
+        sums, mins, maxs = self.sums, self.mins, self.maxs
+        for k, s, lo, hi in partials:
+            if k in sums:
+                sums[k] += s
+                mins[k] = min(mins[k], lo)
+                maxs[k] = max(maxs[k], hi)
+            else:
+                sums[k], mins[k], maxs[k] = s, lo, hi
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self._combine((k, other.sums[k], other.mins[k], other.maxs[k]) for k in other.sums)
+        return self
+
+    def count(self):
+        return dict(self.counts)
+
+    def sum(self):
+        return dict(self.sums)
+
+    def mean(self):
+        return {k: s / self.counts[k] for k, s in self.sums.items()}
+
+    def min(self):
+        return dict(self.mins)
+
+    def max(self):
+        return dict(self.maxs)
+
+    def top(self, k=1, by='count'):
+        # the k groups with the largest count (or sum, mean, min, max)
+        if by == 'count':
+            return self.counts.most_common(k)
+        values = getattr(self, by)()
+        return sorted(values.items(), key=itemgetter(1), reverse=True)[:k]
+
+    # Only the totals travel between processes, so key and value may be lambdas.
+    # A GroupBy received from a worker can be merged and read, not updated.
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['key'] = state['value'] = None
+        return state
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import tempfile
+    import time
+    from csv_records import read_rows
+
+    styles = ['American IPA', 'American Pale Ale', 'Saison', 'Imperial IPA', 'Stout']
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='ISO-8859-1') as f:
+        f.write('BeerID,Name,Style,ABV\n')
+        for i in range(200_000):
+            f.write('%d,Beer %d,%s,%.2f\n' % (i, i, random.choice(styles), random.uniform(3, 12)))
+        path = f.name
+
+    def consume_generator():
+        rows = read_rows(path)
+        columns = next(rows)
+        beerdicts = (dict(zip(columns, data)) for data in rows)
+        beer_counts = {}
+        for bd in beerdicts:
+            if bd['Style'] not in beer_counts:
+                beer_counts[bd['Style']] = 1
+            else:
+                beer_counts[bd['Style']] +=1
+        most_popular = 0
+        most_popular_type = None
+        for beer, count in beer_counts.items():
+            if count > most_popular:
+                most_popular = count
+                most_popular_type = beer
+        return most_popular_type
+
+    t0 = time.perf_counter()
+    expected = consume_generator()
+    t1 = time.perf_counter()
+    rows = read_rows(path, ['Style', 'ABV'])
+    next(rows)
+    styles = GroupBy(0, lambda row: float(row[1])).update(rows)
+    t2 = time.perf_counter()
+    assert styles.top(1)[0][0] == expected
+    print('consume_generator %.0f ms, GroupBy %.0f ms' % (1000 * (t1 - t0), 1000 * (t2 - t1)))
+    print('most popular:', styles.top(1))
+    print('strongest on average:', styles.top(1, by='mean'))
+
+    # two halves aggregated separately merge into the same totals
+    rows = read_rows(path, ['Style', 'ABV'])
+    next(rows)
+    rows = list(rows)
+    abv = lambda row: float(row[1])
+    left = GroupBy(0, abv).update(rows[:100_000])
+    right = GroupBy(0, abv).update(rows[100_000:])
+    merged = left.merge(right)
+    assert merged.count() == styles.count() and merged.max() == styles.max()
+    assert all(abs(merged.sum()[k] - styles.sum()[k]) < 1e-6 for k in styles.sum())
+    os.remove(path)
+
+    # any hashable keys; sums, mins and maxs keep the type of the values
+    mixed = GroupBy(0, 1).update([(('a', 1), 2), ('b', 3), (('a', 1), 5), (None, 7), ('b', 2**60)])
+    assert mixed.sum() == {('a', 1): 7, 'b': 3 + 2**60, None: 7}
+    assert all(type(v) is int for v in mixed.sum().values()) and mixed.min()[('a', 1)] == 2
+    floats = GroupBy(0, 1, batch_size=2).update([(1, 0.5), ('1', 1.5), (1, 2.0)])
+    assert floats.sum() == {1: 2.5, '1': 1.5} and floats.max() == {1: 2.0, '1': 1.5}
@@ -0,0 +1,162 @@
+import asyncio
+import inspect
+
+from pipeline import mult
+
+# async_pipe is the asyncio counterpart of pipeline.pipe. A stage can be a plain
+# function or a coroutine function; the result of each call is awaited only
+# when it is awaitable, so partials of coroutine functions work as well.
+#
+# Every stage runs `concurrency` worker tasks that read from a bounded queue and
+# write into the next one. While one lookup waits on I/O the other workers keep
+# going, and a slow stage fills its input queue, which in turn blocks the
+# stages before it (backpressure) instead of buffering the whole stream.
+#
+# Items carry their input position, so ordered=True can restore the input
+# order at the end. ordered=False yields results as soon as they are done.
+# With ordered=True the source takes a ticket for every item it sends and the
+# tickets come back only in input order, so one slow item holds back at most
+# as many items as the queues and workers can hold, not the whole stream.
+
+_DONE = object()
+
+async def _aiter(source):
+    if hasattr(source, '__aiter__'):
+        async for x in source:
+            yield x
+    else:
+        for x in source:
+            yield x
+
+async def _source(source, out, tickets=None):
+    i = 0
+    async for x in _aiter(source):
+        if tickets is not None:
+            await tickets.acquire()
+        await out.put((i, x))
+        i += 1
+    await out.put(_DONE)
+
+async def _work(f, inbox, out):
+    while True:
+        item = await inbox.get()
+        if item is _DONE:
+            # let the sibling workers of this stage see the end as well
+            inbox.put_nowait(_DONE)
+            return
+        i, x = item
+        x = f(x)
+        if inspect.isawaitable(x):
+            x = await x
+        await out.put((i, x))
+
+async def _stage(f, concurrency, inbox, out):
+    await asyncio.gather(*(_work(f, inbox, out) for _ in range(concurrency)))
+    await out.put(_DONE)
+
+def async_pipe(fns, concurrency=1, maxsize=16, ordered=True):
+    fns = list(fns)
+    limits = list(concurrency) if isinstance(concurrency, (list, tuple)) else [concurrency] * len(fns)
+    if len(limits) != len(fns):
+        raise ValueError('%d concurrency values for %d stages' % (len(limits), len(fns)))
+    if any(n < 1 for n in limits):
+        raise ValueError('concurrency must be at least 1, got %r' % (concurrency,))
+    # what the queues and workers hold when all of them are full
+    window = maxsize * (len(fns) + 1) + sum(limits)
+
+    async def run(source):
+        queues = [asyncio.Queue(maxsize) for _ in range(len(fns) + 1)]
+        tickets = asyncio.Semaphore(window) if ordered else None
+        tasks = [asyncio.ensure_future(_source(source, queues[0], tickets))]
+        tasks += [asyncio.ensure_future(_stage(f, n, queues[i], queues[i + 1]))
+                  for i, (f, n) in enumerate(zip(fns, limits))]
+        failed = []
+
+        def on_done(task):
+            if task.cancelled() or task.exception() is None or failed:
+                return
+            failed.append(task.exception())
+            for t in tasks:
+                t.cancel()
+            # wake up the consumer, whatever is still queued is thrown away
+            last = queues[-1]
+            while not last.empty():
+                last.get_nowait()
+            last.put_nowait(_DONE)
+
+        for t in tasks:
+            t.add_done_callback(on_done)
+
+        waiting = {}
+        expected = 0
+        try:
+            while True:
+                item = await queues[-1].get()
+                if item is _DONE:
+                    break
+                if not ordered:
+                    yield item[1]
+                    continue
+                waiting[item[0]] = item[1]
+                while expected in waiting:
+                    tickets.release()
+                    yield waiting.pop(expected)
+                    expected += 1
+            if failed:
+                raise failed[0]
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return run
+
+
+# A stand-in for a remote lookup service: every request takes 10 ms.
+async def lookup(x):
+    await asyncio.sleep(0.01)
+    return x + 1000
+
+async def benchmark(n=500):
+    import time
+    for concurrency in (1, 10, 100):
+        p = async_pipe([mult, lookup, mult], concurrency=[1, concurrency, 1], maxsize=2 * concurrency)
+        t0 = time.perf_counter()
+        result = [x async for x in p(range(n))]
+        elapsed = time.perf_counter() - t0
+        assert result == [(x * 2 + 1000) * 2 for x in range(n)]
+        print('concurrency %3d: %.2f s, %.0f items/s' % (concurrency, elapsed, n / elapsed))
+
+
+if __name__ == '__main__':
+    async def main():
+        p = async_pipe([mult, lookup, (lambda x: print(f'print result of async pipe: {x}') or x)],
+                       concurrency=[1, 4, 1])
+        print([x async for x in p(range(5))])
+        for bad in ([1], [1, 0, 1]):
+            try:
+                async_pipe([mult, lookup, mult], concurrency=bad)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(bad)
+        # the first item is the slowest, the others wait for it in order
+        async def first_slow(x):
+            await asyncio.sleep(0.2 if x == 0 else 0)
+            return x
+        drawn = []
+        def numbers():
+            for x in range(1000):
+                drawn.append(x)
+                yield x
+        p = async_pipe([first_slow], concurrency=50, maxsize=4)
+        seen = []
+        async for x in p(numbers()):
+            if not seen:
+                # read no further than 4 * 2 queued + 50 in the workers
+                assert len(drawn) <= 4 * 2 + 50 + 1, len(drawn)
+            seen.append(x)
+        assert seen == list(range(1000))
+        await benchmark()
+
+    asyncio.run(main())
@@ -0,0 +1,179 @@
+import csv
+from collections import namedtuple
+from functools import lru_cache, partial
+from itertools import chain, islice
+from operator import itemgetter
+
+# The beer pipeline in generators.py reads the CSV like this:
+#
+#     lines = (line for line in open(beer_data, encoding='ISO-8859-1'))
+#     lists = (l.split(',') for l in lines)
+#     columns = next(lists)
+#     beerdicts = (dict(zip(columns, data)) for data in lists)
+#
+# split(',') breaks on quoted fields like "Imperial, Double IPA", and every
+# row becomes a fresh dict just to look up bd['Style'] and bd['ABV'].
+#
+# read_rows parses the file with the csv module on top of a large read buffer
+# and yields plain tuples. Blank lines are skipped, and a row whose number of
+# fields differs from the header raises ValueError. The widths are checked a
+# chunk of CHUNK_SIZE rows at a time (set(map(len, chunk)) in C), so no
+# Python code runs per row; only a chunk with a blank line or a bad row is
+# looked at row by row. With `columns`, only those columns are kept, in that
+# order; the positions are looked up once from the header and an itemgetter
+# cuts them out of each row in C.
+#
+# read_records yields records of a namedtuple class built once per file, so a
+# record is just the row tuple: no __dict__, and r.Style is a C-level field
+# lookup. A converter such as {'ABV': float} replaces the plain field with a
+# property that converts when the column is actually read, so rows a filter
+# throws away are never converted. A record is still a second allocation on
+# top of the row tuple, so read_rows stays faster where the fields are only
+# unpacked. Column names that aren't valid identifiers are renamed to _0, _1,
+# ... as namedtuple does. The classes of the last RECORD_TYPES layouts are
+# kept, so a layout that is read again (or unpickled) gets the same class,
+# while a new lambda converter per call doesn't leave a class behind for good.
+
+BUFFER_SIZE = 1 << 20
+CHUNK_SIZE = 1024
+RECORD_TYPES = 256
+
+
+def record_type(columns, converters=None, name='Record'):
+    # one class per layout, so records from different reads (or unpickled
+    # from a cache) share it
+    converters = converters or {}
+    return _record_type((tuple(columns), tuple(sorted(converters.items())), name))
+
+@lru_cache(maxsize=RECORD_TYPES)
+def _record_type(layout):
+    columns, converters, name = layout
+    converters = dict(converters)
+    base = namedtuple(name, columns, rename=True)
+    namespace = {'__slots__': (), '_layout': layout,
+                 '__reduce__': lambda self: (_make_record, (layout, tuple(self)))}
+    for i, (column, field) in enumerate(zip(columns, base._fields)):
+        convert = converters.get(column)
+        if convert is not None:
+            namespace[field] = property(lambda self, i=i, convert=convert: convert(tuple.__getitem__(self, i)))
+    return type(name, (base,), namespace)
+
+def _make_record(layout, row):
+    columns, converters, name = layout
+    return tuple.__new__(record_type(columns, dict(converters), name), row)
+
+
+def _projection(header, columns):
+    index = [header.index(c) for c in columns]
+    if len(index) == 1:
+        i, = index
+        return lambda row: (row[i],)
+    return itemgetter(*index)
+
+def _chunks(reader, width):
+    # chunks of rows; skips blank lines like csv.DictReader, rejects rows of
+    # another width. Rows are numbered from the header as row 1, which is the
+    # line number unless a quoted field spans lines.
+    number = 1
+    while True:
+        chunk = list(islice(reader, CHUNK_SIZE))
+        if not chunk:
+            return
+        if set(map(len, chunk)) != {width}:
+            for i, row in enumerate(chunk, number + 1):
+                if row and len(row) != width:
+                    raise ValueError('Row %d has %d fields, the header has %d' % (i, len(row), width))
+            chunk = list(filter(None, chunk))
+        number += CHUNK_SIZE
+        yield chunk
+
+def _reader(f, columns, header=None):
+    # the header and an iterator over the rows of the open file f
+    reader = csv.reader(f)
+    header = header or next(reader, None)
+    if header is None:
+        return None, None
+    rows = chain.from_iterable(_chunks(reader, len(header)))
+    if columns is None:
+        return tuple(header), map(tuple, rows)
+    return tuple(columns), map(_projection(header, columns), rows)
+
+def read_rows(path, columns=None, encoding='ISO-8859-1', header=None):
+    # yields the header first, then one tuple per row
+    with open(path, newline='', encoding=encoding, buffering=BUFFER_SIZE) as f:
+        header, rows = _reader(f, columns, header)
+        if header is None:
+            return
+        yield header
+        yield from rows
+
+def read_records(path, columns=None, converters=None, encoding='ISO-8859-1'):
+    # the rows go straight from the reader into records, not through read_rows
+    with open(path, newline='', encoding=encoding, buffering=BUFFER_SIZE) as f:
+        header, rows = _reader(f, columns)
+        if header is None:
+            return
+        yield from map(partial(tuple.__new__, record_type(header, converters)), rows)
+
+
+if __name__ == '__main__':
+    import os
+    import random
+    import tempfile
+    import time
+
+    styles = ['American IPA', 'American Pale Ale', 'Saison', '"Imperial, Double IPA"']
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='ISO-8859-1') as f:
+        f.write('BeerID,Name,Style,OG,FG,ABV,IBU,Color\n')
+        for i in range(200_000):
+            f.write('%d,Beer %d,%s,1.05,1.01,%.2f,%d,%.1f\n'
+                    % (i, i, random.choice(styles), random.uniform(3, 12), random.randint(5, 100), random.uniform(2, 40)))
+        path = f.name
+
+    def split_pipeline():
+        lines = (line for line in open(path, encoding='ISO-8859-1'))
+        lists = (l.split(',') for l in lines)
+        columns = next(lists)
+        beerdicts = (dict(zip(columns, data)) for data in lists)
+        return [float(bd['ABV']) for bd in beerdicts if bd['Style'] == 'American IPA']
+
+    def row_pipeline():
+        rows = read_rows(path, ['Style', 'ABV'])
+        next(rows)
+        return [float(abv) for style, abv in rows if style == 'American IPA']
+
+    def record_pipeline():
+        records = read_records(path, ['Style', 'ABV'], {'ABV': float})
+        return [r.ABV for r in records if r.Style == 'American IPA']
+
+    expected = None
+    for f in (split_pipeline, row_pipeline, record_pipeline):
+        t0 = time.perf_counter()
+        result = f()
+        print('%-16s %.0f ms' % (f.__name__, 1000 * (time.perf_counter() - t0)))
+        assert expected is None or result == expected
+        expected = result
+
+    # the quoted style is one field here, split(',') would cut it in two
+    print(next(r for r in read_records(path) if r.Style.startswith('Imperial')))
+    os.remove(path)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+        f.write('Style,ABV\nIPA,5.0\n\nSaison,6\n')
+    assert [r.ABV for r in read_records(f.name, converters={'ABV': float})] == [5.0, 6.0]
+    assert list(read_rows(f.name, ['ABV'])) == [('ABV',), ('5.0',), ('6',)]
+    with open(f.name, 'a') as short:
+        short.write('Stout\n')
+    try:
+        list(read_records(f.name))
+    except ValueError as e:
+        print(e)
+    else:
+        raise AssertionError('short row')
+    os.remove(f.name)
+
+    # a new lambda converter per call doesn't pile up classes
+    for i in range(2 * RECORD_TYPES):
+        record_type(['ABV'], {'ABV': lambda v: float(v)})
+    assert _record_type.cache_info().currsize == RECORD_TYPES
+    assert record_type(['ABV']) is record_type(('ABV',), {})
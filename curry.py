@@ -1,4 +1,9 @@
-def curry(func):
+import inspect
+from functools import partial, wraps
+from inspect import Parameter
+
+
+def naive_curry(func):
     def curried(*args, **kwargs):
         if len(args) + len(kwargs) >= func.__code__.co_argcount:
             return func(*args, **kwargs)
@@ -6,15 +11,92 @@ def curry(func):
                 curried(*(args + args2), **dict(kwargs, **kwargs2)))
     return curried
 
-@curry
-def myfun(a,b,c):
-    return a + b + c 
 
-fn1 = myfun(10)(20)
-fn2 = fn1(20)
+# naive_curry asks func.__code__ for the number of arguments on every call and
+# wraps every partial application in a new lambda.
+# curry reads the signature once. A function is applied as soon as every
+# parameter without a default is bound; parameters with defaults, *args and
+# **kwargs never have to be supplied. This is not what naive_curry does: it
+# waits for as many arguments as func has positional parameters, defaults
+# included, so for f(a, b=1) naive_curry(f)(1) is still a partial application
+# while curry(f)(1) calls f(1, 1). Calls with all positional arguments at once
+# go straight to func(*args) without building anything; with keywords, a
+# count of the arguments and one set comparison against the names still
+# missing decide. Partial
+# applications are functools.partial objects: they are implemented in C, they
+# merge arguments on their own and partial(partial(f, 1), 2) collapses into
+# partial(f, 1, 2).
+
+_POSITIONAL = Parameter.POSITIONAL_ONLY, Parameter.POSITIONAL_OR_KEYWORD
+
+def _required(func):
+    try:
+        params = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        # no signature (some builtins): call it with whatever we get
+        return (), frozenset()
+    positional = tuple(p.name for p in params
+                       if p.kind in _POSITIONAL and p.default is p.empty)
+    keyword_only = frozenset(p.name for p in params
+                             if p.kind is Parameter.KEYWORD_ONLY and p.default is p.empty)
+    return positional, keyword_only
+
+def curry(func):
+    positional, keyword_only = _required(func)
+    # with required keyword-only parameters a purely positional call is never complete
+    fast = len(positional) if not keyword_only else float('inf')
+    # need[n]: the names that must be keywords when n arguments are positional
+    need = [keyword_only.union(positional[n:]) for n in range(len(positional))]
+    last = len(positional)
+    # every required parameter takes one argument, so fewer can't be enough
+    required = len(positional) + len(keyword_only)
+    def curried(*args, **kwargs):
+        if not kwargs:
+            if len(args) >= fast:
+                return func(*args)
+        elif (len(args) + len(kwargs) >= required
+              and (need[len(args)] if len(args) < last else keyword_only).issubset(kwargs)):
+            return func(*args, **kwargs)
+        return partial(curried, *args, **kwargs)
+    return wraps(func)(curried)
+
+
+def benchmark(number=500_000):
+    import timeit
+    def add3(a, b, c):
+        return a + b + c
+    for name, c in (('naive_curry', naive_curry(add3)), ('curry', curry(add3))):
+        add1 = c(1)
+        cases = [('f(1, 2, 3)', lambda: c(1, 2, 3)),
+                 ('f(1)(2)(3)', lambda: c(1)(2)(3)),
+                 ('g = f(1); g(2, 3)', lambda: add1(2, 3)),
+                 ('f(1, b=2)(c=3)', lambda: c(1, b=2)(c=3))]
+        for case, f in cases:
+            best = min(timeit.repeat(f, number=number, repeat=3))
+            print('%-12s %-18s %.0f ns/call' % (name, case, best / number * 1e9))
+
+
+if __name__ == '__main__':
+    @curry
+    def myfun(a,b,c):
+        return a + b + c
+
+    fn1 = myfun(10)(20)
+    fn2 = fn1(20)
 
-print(fn2)
+    print(fn2)
 
+    @curry
+    def scale(x, factor=2, *rest, offset, **options):
+        return x * factor + offset
 
+    assert scale(5)(offset=1) == 11
+    assert scale(offset=1)(5, 3) == 16
+    assert myfun(1, 2, 3) == myfun(1)(2)(3) == myfun(1, c=3)(b=2) == 6
 
+    # applied once the parameters without defaults are bound, unlike naive_curry
+    def power(x, n=2):
+        return x ** n
+    assert curry(power)(3) == 9 and callable(naive_curry(power)(3))
 
+    benchmark()
@@ -0,0 +1,258 @@
+import os
+import pickle
+import queue
+import struct
+import threading
+from functools import partial
+from itertools import chain, islice
+
+from csv_records import read_records, record_type
+
+# The gotcha of the generator pipeline in generators.py: lines, lists and
+# beerdicts are one-shot iterators. consume_generator() empties beerdicts and
+# the abv generator defined after it has nothing left to read.
+#
+# A Dataset holds a function that opens the source instead of an open
+# iterator. Every `for` over it calls that function again, so it can be
+# iterated any number of times, and map()/filter() build new datasets lazily
+# on top of iterating it, so a map() over a cached dataset reads the cache.
+#
+# Re-opening still means re-parsing. Two ways around that:
+# - fan_out(*consumers) reads the source once and hands every item to all
+#   consumers. Each consumer runs in its own thread on a bounded queue of
+#   batches, so a slow consumer holds the reader back instead of letting the
+#   buffer grow.
+# - cache() keeps the batches of the first complete pass in memory, or in a
+#   pickle file when given a path, and replays them on every later pass.
+#   CSV records go to the file as plain tuples plus the number of their
+#   layout, and are turned back into records when the file is read. The
+#   layouts are written once, after the last batch, and the file starts with
+#   where they are. A layout whose converters can't be pickled (a lambda) is
+#   only known to the CachedDataset that wrote it; any other one takes the
+#   file as stale and fills it again. A pass that is cut short leaves no file.
+
+BATCH_SIZE = 1024
+_DONE = object()
+_OFFSET = struct.Struct('<q')
+
+
+def _batches(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Dataset:
+    def __init__(self, open_source):
+        self.open_source = open_source
+
+    def __iter__(self):
+        return iter(self.open_source())
+
+    def map(self, f):
+        return Dataset(lambda: map(f, self))
+
+    def filter(self, f):
+        return Dataset(lambda: filter(f, self))
+
+    def cache(self, path=None):
+        return CachedDataset(self.open_source, path)
+
+    def fan_out(self, *consumers, buffer=8):
+        # run every consumer(iterable) over a single pass, return their results
+        inboxes = [queue.Queue(buffer) for _ in consumers]
+        results = [None] * len(consumers)
+        errors = []
+
+        def items(inbox, finished):
+            yield from chain.from_iterable(iter(inbox.get, _DONE))
+            finished.append(True)
+
+        def run(i, consumer, inbox):
+            finished = []
+            try:
+                results[i] = consumer(items(inbox, finished))
+            except BaseException as e:
+                errors.append(e)
+            # a consumer that stopped early must not block the reader
+            if not finished:
+                for _ in iter(inbox.get, _DONE):
+                    pass
+
+        threads = [threading.Thread(target=run, args=(i, c, q), daemon=True)
+                   for i, (c, q) in enumerate(zip(consumers, inboxes))]
+        for t in threads:
+            t.start()
+        try:
+            for batch in _batches(self, BATCH_SIZE):
+                for inbox in inboxes:
+                    inbox.put(batch)
+        finally:
+            for inbox in inboxes:
+                inbox.put(_DONE)
+            for t in threads:
+                t.join()
+        if errors:
+            raise errors[0]
+        return results
+
+
+class CachedDataset(Dataset):
+    def __init__(self, open_source, path=None):
+        super().__init__(open_source)
+        self.path = path
+        self.batches = None
+        # record types written under a token that only this dataset knows
+        self.token = os.urandom(8)
+        self.local = []
+
+    def __iter__(self):
+        if self.batches is not None:
+            return chain.from_iterable(self.batches)
+        if self.path is not None and os.path.exists(self.path):
+            found = self._types()
+            if found is not None:
+                return chain.from_iterable(self._load(*found))
+        return self._fill()
+
+    def _fill(self):
+        batches = []
+        tmp = self.path + '.tmp' if self.path is not None else None
+        out = open(tmp, 'wb') if tmp is not None else None
+        layouts, numbers = [], {}
+        complete = False
+        try:
+            if out is not None:
+                out.write(_OFFSET.pack(0))
+            for batch in _batches(self.open_source(), BATCH_SIZE):
+                if out is None:
+                    batches.append(batch)
+                else:
+                    pickle.dump(self._pack(batch, layouts, numbers), out, pickle.HIGHEST_PROTOCOL)
+                yield from batch
+            if out is not None:
+                table = out.tell()
+                pickle.dump(layouts, out, pickle.HIGHEST_PROTOCOL)
+                out.seek(0)
+                out.write(_OFFSET.pack(table))
+            complete = True
+        finally:
+            # only a complete pass is kept
+            if out is not None:
+                out.close()
+                if complete:
+                    os.replace(tmp, self.path)
+                else:
+                    os.remove(tmp)
+        if out is None:
+            self.batches = batches
+
+    def _pack(self, batch, layouts, numbers):
+        # (layout number, plain rows), or (None, batch) for other items
+        cls = type(batch[0])
+        layout = getattr(cls, '_layout', None)
+        if layout is None:
+            return None, batch
+        number = numbers.get(cls)
+        if number is None:
+            number = numbers[cls] = len(layouts)
+            try:
+                pickle.dumps(layout)
+            except (pickle.PicklingError, AttributeError, TypeError):
+                layout = ('local', self.token, len(self.local))
+                self.local.append(cls)
+            layouts.append(layout)
+        return number, list(map(tuple, batch))
+
+    def _types(self):
+        # the record types of the file and where its batches end, or None
+        # when the file can't be read back here
+        try:
+            with open(self.path, 'rb') as f:
+                table, = _OFFSET.unpack(f.read(_OFFSET.size))
+                f.seek(table)
+                layouts = pickle.load(f)
+        except (OSError, EOFError, ValueError, struct.error, pickle.UnpicklingError):
+            return None
+        types = []
+        for layout in layouts:
+            if layout[0] == 'local':
+                if layout[1] != self.token:
+                    return None
+                types.append(self.local[layout[2]])
+            else:
+                columns, converters, name = layout
+                types.append(record_type(columns, dict(converters), name))
+        return types, table
+
+    def _load(self, types, end):
+        with open(self.path, 'rb') as f:
+            f.seek(_OFFSET.size)
+            while f.tell() < end:
+                number, rows = pickle.load(f)
+                yield rows if number is None else list(map(partial(tuple.__new__, types[number]), rows))
+
+
+def csv_dataset(path, columns=None, converters=None, encoding='ISO-8859-1'):
+    return Dataset(lambda: read_records(path, columns, converters, encoding))
+
+
+if __name__ == '__main__':
+    import random
+    import tempfile
+    import time
+    from aggregate import GroupBy
+
+    styles = ['American IPA', 'American Pale Ale', 'Saison', 'Imperial IPA', 'Stout']
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='ISO-8859-1') as f:
+        f.write('BeerID,Name,Style,ABV\n')
+        for i in range(200_000):
+            f.write('%d,Beer %d,%s,%.2f\n' % (i, i, random.choice(styles), random.uniform(3, 12)))
+        path = f.name
+
+    beers = csv_dataset(path, ['Style', 'ABV'], {'ABV': float})
+
+    def most_popular(records):
+        return GroupBy(0).update(records).top(1)
+
+    def abv(records):
+        return max(r.ABV for r in records if r.Style == 'American IPA')
+
+    # both analyses work, the dataset is simply read twice
+    print(most_popular(beers), abv(beers))
+
+    t0 = time.perf_counter()
+    print(beers.fan_out(most_popular, abv), 'one pass: %.0f ms' % (1000 * (time.perf_counter() - t0)))
+
+    for where, cached in (('memory', beers.cache()), ('disk', beers.cache(path + '.pickle'))):
+        for run in ('first', 'second'):
+            t0 = time.perf_counter()
+            result = most_popular(cached), abv(cached)
+            print(result, '%s run, cached in %s: %.0f ms' % (run, where, 1000 * (time.perf_counter() - t0)))
+    os.remove(path + '.pickle')
+
+    # map/filter over a cached dataset read the cache, not the source
+    opened = []
+    def counted():
+        opened.append(True)
+        return read_records(path, ['Style', 'ABV'], {'ABV': lambda v: float(v)})
+    for where in (None, path + '.pickle'):
+        opened.clear()
+        strong = Dataset(counted).cache(where).map(lambda r: r.ABV).filter(lambda abv: abv > 11)
+        first = list(strong)
+        assert first and list(strong) == first and len(opened) == 1, len(opened)
+    # the lambda converter came back from disk, typed; a dataset that doesn't
+    # know the lambda refills the file from the source
+    assert all(type(abv) is float for abv in first)
+    again = CachedDataset(counted, path + '.pickle').map(lambda r: r.ABV).filter(lambda abv: abv > 11)
+    assert list(again) == first and len(opened) == 2
+    os.remove(path + '.pickle')
+    # a pass that stops early leaves nothing behind
+    partial_pass = iter(Dataset(counted).cache(path + '.pickle'))
+    next(partial_pass)
+    partial_pass.close()
+    assert not os.path.exists(path + '.pickle') and not os.path.exists(path + '.pickle.tmp')
+    os.remove(path)
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+# memoize (see memoize.py) lives in the memory of one process: a restart or a
+# second worker in a process pool starts from an empty cache again.
+# disk_memoize keeps the results in a SQLite file instead, so every process
+# that opens the same file shares them:
+#
+# - The key is a sha256 of the pickled (function name, args, kwargs), pickled
+#   with a fixed protocol so it is the same in every process. Arguments whose
+#   pickle is not deterministic (e.g. sets of strings under hash randomization)
+#   simply miss more often.
+# - SQLite handles the locking between processes. The file runs in WAL mode, so
+#   readers don't block the writer.
+# - With max_bytes set, the least recently used rows are deleted whenever the
+#   stored values grow past the limit. The running total lives in the file too.
+#   A hit doesn't write its access time right away, which would make every
+#   reader wait for the write lock: the times are collected per connection and
+#   written together, every TOUCH_BATCH hits or TOUCH_INTERVAL seconds, and
+#   before this connection evicts anything. Should the running total ever
+#   count more than the rows hold, eviction stops once the rows run out and
+#   takes the total from SUM(size) again.
+# - Each thread of each process opens its own connection (connections must
+#   not cross a fork, and sqlite3 connections belong to their thread).
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS memo (key TEXT PRIMARY KEY, value BLOB, size INTEGER, atime REAL);
+CREATE INDEX IF NOT EXISTS memo_atime ON memo (atime);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);
+INSERT OR IGNORE INTO meta VALUES ('bytes', 0);
+'''
+
+_MISSING = object()
+_PROTOCOL = 4
+TOUCH_BATCH = 256
+TOUCH_INTERVAL = 1.0
+
+
+class DiskCache:
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _conn(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            local.db.execute('PRAGMA journal_mode=WAL')
+            local.db.execute('PRAGMA synchronous=NORMAL')
+            local.db.executescript(_SCHEMA)
+            local.touched = {}
+            local.flushed = time.monotonic()
+            local.pid = os.getpid()
+        return local.db
+
+    def get(self, key):
+        db = self._conn()
+        row = db.execute('SELECT value FROM memo WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return _MISSING
+        if self.max_bytes is not None:
+            local = self._local
+            local.touched[key] = time.time()
+            if len(local.touched) >= TOUCH_BATCH or time.monotonic() - local.flushed > TOUCH_INTERVAL:
+                db.execute('BEGIN IMMEDIATE')
+                try:
+                    self._flush(db)
+                    db.execute('COMMIT')
+                except BaseException:
+                    db.execute('ROLLBACK')
+                    raise
+        return pickle.loads(row[0])
+
+    def _flush(self, db):
+        # write the collected access times, inside the caller's transaction
+        local = self._local
+        if local.touched:
+            db.executemany('UPDATE memo SET atime = ? WHERE key = ?',
+                           [(t, key) for key, t in local.touched.items()])
+            local.touched = {}
+        local.flushed = time.monotonic()
+
+    def set(self, key, value):
+        blob = pickle.dumps(value, _PROTOCOL)
+        if self.max_bytes is not None and len(blob) > self.max_bytes:
+            return
+        db = self._conn()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            old = db.execute('SELECT size FROM memo WHERE key = ?', (key,)).fetchone()
+            db.execute('INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?)',
+                       (key, blob, len(blob), time.time()))
+            db.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'",
+                       (len(blob) - (old[0] if old else 0),))
+            if self.max_bytes is not None:
+                self._evict(db)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def _evict(self, db):
+        self._flush(db)
+        total, = db.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()
+        while total > self.max_bytes:
+            rows = db.execute('SELECT key, size FROM memo ORDER BY atime LIMIT 64').fetchall()
+            if not rows:
+                # the running total drifted from the rows, count them again
+                total, = db.execute('SELECT COALESCE(SUM(size), 0) FROM memo').fetchone()
+                break
+            for key, size in rows:
+                db.execute('DELETE FROM memo WHERE key = ?', (key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        db.execute("UPDATE meta SET value = ? WHERE name = 'bytes'", (total,))
+
+    def stats(self):
+        db = self._conn()
+        count, = db.execute('SELECT COUNT(*) FROM memo').fetchone()
+        total, = db.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()
+        return {'entries': count, 'bytes': total}
+
+    def clear(self):
+        db = self._conn()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('DELETE FROM memo')
+            db.execute("UPDATE meta SET value = 0 WHERE name = 'bytes'")
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        self._local.touched = {}
+
+
+def make_key(name, args, kwargs):
+    data = pickle.dumps((name, args, sorted(kwargs.items())), _PROTOCOL)
+    return hashlib.sha256(data).hexdigest()
+
+def disk_memoize(path, max_bytes=None):
+    cache = DiskCache(path, max_bytes)
+    def decorator(fnc):
+        name = '%s.%s' % (fnc.__module__, fnc.__qualname__)
+        @wraps(fnc)
+        def inner(*args, **kwargs):
+            key = make_key(name, args, kwargs)
+            value = cache.get(key)
+            if value is _MISSING:
+                value = fnc(*args, **kwargs)
+                cache.set(key, value)
+            return value
+        inner.cache = cache
+        return inner
+    return decorator
+
+
+CACHE_FILE = os.path.join(os.environ.get('TMPDIR', '/tmp'), 'memo-prime.sqlite')
+
+@disk_memoize(CACHE_FILE, max_bytes=1 << 20)
+def cached_prime(n):
+
+    for i in range(n, 0, -1):
+        if all([i // x != i / x for x in range(i-1, 1, -1)]):
+            return i
+
+
+if __name__ == '__main__':
+    from concurrent.futures import ProcessPoolExecutor
+
+    cached_prime.cache.clear()
+    numbers = [2000 + 500 * i for i in range(16)]
+    for run in ('cold', 'warm'):
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(4) as pool:
+            primes = list(pool.map(cached_prime, numbers))
+        print('%s run: %.3f s' % (run, time.perf_counter() - t0), primes[:4])
+    print(cached_prime.cache.stats())
+
+    # threads of one process each get their own connection
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(4) as pool:
+        assert list(pool.map(cached_prime, numbers)) == primes
+
+    # a running total that drifted past the rows empties the cache once and
+    # is counted again, instead of keeping eviction looping
+    db = cached_prime.cache._conn()
+    db.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'", (1 << 30,))
+    cached_prime(2)
+    stats = cached_prime.cache.stats()
+    assert stats['bytes'] == db.execute('SELECT COALESCE(SUM(size), 0) FROM memo').fetchone()[0], stats
+    print(stats)
@@ -0,0 +1,367 @@
+import hashlib
+import re
+from collections import OrderedDict
+from copy import deepcopy
+from functools import lru_cache
+from itertools import islice, repeat
+from operator import contains
+from json import JSONDecodeError, JSONDecoder, dumps, loads
+from json.decoder import WHITESPACE, scanstring
+
+# exceptions.load_json_key parses the whole document to read one key:
+#
+#     def load_json_key(data, key):
+#         try:
+#             result_dict = json.loads(data) # May raise ValueError
+#         except ValueError as e:
+#             raise KeyError from e
+#         else:
+#             return result_dict.get(key, 10)
+#
+# scan_keys(data, keys) reads the members of the top-level object one at a
+# time and stops as soon as it has all the keys it was asked for. Keys and
+# values are parsed by the json module's own C scanner (scanstring and the
+# decoder's scan_once), and the members after the last wanted key are never
+# parsed at all.
+# - Invalid JSON before that point raises JSONDecodeError (a ValueError);
+#   whatever comes after it is not looked at.
+# - A member costs more in the scan loop than inside json.loads. So when a
+#   key is not in the text at all, or first shows up past FAR of it (found
+#   with str.find, which runs at memory speed), the document is parsed with
+#   one json.loads instead, which also validates all of it.
+# - The scan stops at the first member with each wanted key and never looks
+#   further, so of two equal top-level keys the first one wins (json.loads
+#   keeps the last). Where the document is parsed with json.loads instead,
+#   a wanted key written twice (str.count, a spelling with other escapes is
+#   not counted) has the top level parsed again so that the first wins there
+#   as well.
+# load_json_key/load_json_keys keep the KeyError-from-ValueError behaviour.
+# They remember, by a SHA-1 hash of the content (the fastest of hashlib's
+# hashes here), which members of a document have been parsed and where the
+# scan stopped, so the same payload queried again is answered from the cache
+# or scanned on from that point. Values are returned as copies, so changing
+# one does not change what the cache answers next time. Hashing reads the
+# whole payload, so for keys near the start a scan with cache=None is cheaper
+# still.
+# extract_ndjson(lines, keys) scans newline-delimited JSON, one document per
+# line, and yields the values of the keys in batches of tuples. Lines shorter
+# than SCAN_MIN go to json.loads, which is faster when there is little to skip.
+# A batch of only such lines is parsed and picked apart with C-level maps, and
+# one str.count per key over the whole batch checks for keys written twice, so
+# it runs a little slower than json.loads with dict.get (the benchmark prints
+# the ratio). Batches are small enough for their documents to stay in cache.
+
+CACHE_SIZE = 64
+BATCH_SIZE = 128
+SCAN_MIN = 512
+FAR = 0.3
+
+_scan_once = JSONDecoder().scan_once
+_ws = WHITESPACE.match
+_colon = re.compile(r'[ \t\n\r]*:[ \t\n\r]*').match
+_delimiter = re.compile(r'[ \t\n\r]*([,}])[ \t\n\r]*').match
+
+
+class _Document:
+    # members parsed so far, where to go on, and whether the end was reached;
+    # checked holds the keys known to be written once when the members come
+    # from json.loads
+    __slots__ = ('members', 'pos', 'done', 'checked')
+
+    def __init__(self):
+        self.members = {}
+        self.checked = None
+        self.pos = None
+        self.done = False
+
+
+def _end(s, pos, doc):
+    # the closing } of the object is at pos
+    end = _ws(s, pos + 1).end()
+    if end != len(s):
+        raise JSONDecodeError('Extra data', s, end)
+    doc.done = True
+    return doc
+
+def _far(s, keys):
+    # whether a key is missing or first written late in s, so that the scan
+    # would cover most of s and one json.loads is cheaper
+    limit = len(s) * FAR
+    for key in keys:
+        found = [i for i in map(s.find, _quoted(key)) if i >= 0]
+        if not found or min(found) > limit:
+            return True
+    return False
+
+@lru_cache(maxsize=1024)
+def _quoted(key):
+    # the ways json.dumps writes key
+    return tuple({dumps(key), dumps(key, ensure_ascii=False)})
+
+def _twice(s, key):
+    # whether key may be written more than once in s
+    return sum(map(s.count, _quoted(key))) > 1
+
+def _first_wins(s):
+    # json.loads(s), with the first of two equal top-level keys kept
+    top = None
+    def pairs_hook(pairs):
+        # the top-level object is the last one to be finished
+        nonlocal top
+        top = pairs
+        return dict(pairs)
+    document = loads(s, object_pairs_hook=pairs_hook)
+    if isinstance(document, dict) and len(document) != len(top):
+        # reversed, so the first of equal keys is stored last
+        return dict(reversed(top))
+    return document
+
+def _settle(s, doc, keys):
+    # members from json.loads hold the last of equal keys; when one of keys
+    # is written twice, the document is parsed again keeping the first
+    unchecked = [k for k in keys if k not in doc.checked]
+    if any(_twice(s, k) for k in unchecked):
+        doc.members = _first_wins(s)
+        doc.checked = None
+    else:
+        doc.checked.update(unchecked)
+    return doc
+
+def _scan(s, doc, keys):
+    # parse members of s into doc until all keys are in doc.members;
+    # doc.pos is the opening quote of the next key
+    if doc.checked is not None:
+        return _settle(s, doc, keys)
+    members = doc.members
+    missing = [k for k in keys if k not in members]
+    if doc.done or not missing:
+        return doc
+    pos = doc.pos
+    if pos is None:
+        pos = _ws(s, 0).end()
+        if s[pos:pos + 1] != '{' or _far(s, missing):
+            # parsed in one go; a document that is not an object has no keys
+            document = loads(s)
+            doc.done = True
+            if not isinstance(document, dict):
+                return doc
+            doc.members = document
+            doc.checked = set()
+            return _settle(s, doc, keys)
+        pos = _ws(s, pos + 1).end()
+        if s[pos:pos + 1] == '}':
+            return _end(s, pos, doc)
+        if s[pos:pos + 1] != '"':
+            raise JSONDecodeError('Expecting property name enclosed in double quotes', s, pos)
+    while missing:
+        key, pos = scanstring(s, pos + 1)
+        colon = _colon(s, pos)
+        if colon is None:
+            raise JSONDecodeError("Expecting ':' delimiter", s, pos)
+        try:
+            value, pos = _scan_once(s, colon.end())
+        except StopIteration as e:
+            raise JSONDecodeError('Expecting value', s, e.value) from None
+        members.setdefault(key, value)
+        if key in missing:
+            missing.remove(key)
+        delimiter = _delimiter(s, pos)
+        if delimiter is None:
+            raise JSONDecodeError("Expecting ',' delimiter", s, _ws(s, pos).end())
+        if delimiter.group(1) == '}':
+            return _end(s, delimiter.start(1), doc)
+        pos = delimiter.end()
+        if s[pos:pos + 1] != '"':
+            raise JSONDecodeError('Expecting property name enclosed in double quotes', s, pos)
+    doc.pos = pos
+    return doc
+
+def _text(data):
+    return data.decode('utf-8') if isinstance(data, (bytes, bytearray)) else data
+
+def scan_keys(data, keys):
+    # {key: value} for the keys that are in the document
+    members = _scan(_text(data), _Document(), keys).members
+    return {k: members[k] for k in keys if k in members}
+
+
+class DocumentCache:
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.docs = OrderedDict()
+
+    def scan(self, data, keys):
+        text = _text(data)
+        digest = hashlib.sha1(data if isinstance(data, (bytes, bytearray)) else text.encode(),
+                              usedforsecurity=False).digest()
+        doc = self.docs.get(digest)
+        if doc is None:
+            doc = self.docs[digest] = _Document()
+            if len(self.docs) > self.maxsize:
+                self.docs.popitem(last=False)
+        else:
+            self.docs.move_to_end(digest)
+        members = _scan(text, doc, keys).members
+        return {k: _copy(members[k]) for k in keys if k in members}
+
+    def clear(self):
+        self.docs.clear()
+
+def _copy(value):
+    return deepcopy(value) if isinstance(value, (list, dict)) else value
+
+_cache = DocumentCache()
+
+
+def load_json_keys(data, keys, default=None, cache=_cache):
+    try:
+        members = cache.scan(data, keys) if cache is not None else scan_keys(data, keys)
+    except ValueError as e:
+        raise KeyError from e
+    return {k: members.get(k, default) for k in keys}
+
+def load_json_key(data, key, default=10, cache=_cache):
+    return load_json_keys(data, (key,), default, cache)[key]
+
+
+def _unique(texts, docs, keys):
+    # whether no key is written twice at the top level of any text: every
+    # time a key is written in the texts, a document has it at the top level
+    joined = '\n'.join(texts)
+    return all(sum(map(joined.count, _quoted(k))) == sum(map(contains, docs, repeat(k))) for k in keys)
+
+def _rows(batch, keys, defaults, number):
+    # the rows of a batch, line by line; number is that of the first line
+    docs = []
+    # the short lines, parsed by json.loads, and where they are in docs
+    texts, loaded, at = [], [], []
+    for number, line in enumerate(batch, number):
+        if not line or line.isspace():
+            continue
+        try:
+            if len(line) < SCAN_MIN:
+                members = loads(line)
+                if type(members) is not dict:
+                    members = {}
+                texts.append(line)
+                loaded.append(members)
+                at.append(len(docs))
+            else:
+                members = _scan(line, _Document(), keys).members
+        except ValueError as e:
+            raise KeyError('line %d' % number) from e
+        docs.append(members)
+    if texts and not _unique(texts, loaded, keys):
+        for text, members, i in zip(texts, loaded, at):
+            if members and any(_twice(text, k) for k in keys):
+                docs[i] = _first_wins(text)
+    return [tuple(map(members.get, keys, defaults)) for members in docs]
+
+def extract_ndjson(lines, keys, default=None, batch_size=BATCH_SIZE):
+    # yields lists of tuples with the values of keys, one tuple per document
+    keys = tuple(keys)
+    defaults = (default,) * len(keys)
+    lines = iter(lines)
+    number = 1
+    while True:
+        batch = list(islice(lines, batch_size))
+        if not batch:
+            return
+        if set(map(type, batch)) != {str}:
+            batch = list(map(_text, batch))
+        if keys and max(map(len, batch)) < SCAN_MIN:
+            # all short: parsed and picked apart with C-level maps, unless a
+            # line is blank, invalid, not an object or has a key twice
+            try:
+                docs = list(map(loads, batch))
+            except ValueError:
+                docs = None
+            if docs is not None and set(map(type, docs)) == {dict} and _unique(batch, docs, keys):
+                yield list(zip(*[map(dict.get, docs, repeat(k), repeat(default)) for k in keys]))
+                number += len(batch)
+                continue
+        yield _rows(batch, keys, defaults, number)
+        number += len(batch)
+
+
+if __name__ == '__main__':
+    import json
+    import random
+    import time
+
+    def json_load_json_key(data, key):
+        try:
+            result_dict = json.loads(data)
+        except ValueError as e:
+            raise KeyError from e
+        else:
+            return result_dict.get(key, 10)
+
+    print('Starting test')
+    doc = '{"a": 10, "b": 20, "c": 30}'
+    assert load_json_key(doc, 'c') == 30 and load_json_key(doc, 'd') == 10
+    assert load_json_keys(doc.encode(), ['a', 'b']) == {'a': 10, 'b': 20}
+    assert scan_keys(' { "x" : [1, {"y": "}"}] , "y\\u00e9" : null } ', ['yé']) == {'yé': None}
+    assert scan_keys('{}', ['a']) == {} and scan_keys('[1, 2]', ['a']) == {}
+    for bad in ('{"a": 1,}', '{"a" 1}', '{"a": 1} x', '{"a": 1', '{"a": 1 "b": 2}', 'nope', ''):
+        try:
+            load_json_key(bad, 'b')
+        except KeyError as e:
+            assert isinstance(e.__cause__, ValueError), bad
+        else:
+            raise AssertionError(bad)
+    # stops at the key, the rest is never parsed
+    assert load_json_key('{"a": 1, "b": oops', 'a', cache=None) == 1
+    assert scan_keys('{"a": 1, "b": {"c": 2}, "c": 3}', ['c']) == {'c': 3}
+    # the first of two equal keys, whatever keys are asked for and whether the
+    # document is scanned or loaded whole
+    twice = '{"a": 1, "b": [2], "a": 2, "z": 0}'
+    assert scan_keys(twice, ['a']) == {'a': 1} and scan_keys(twice, ['a', 'z']) == {'a': 1, 'z': 0}
+    assert load_json_key(twice, 'z') == 0 and load_json_key(twice, 'a') == 1
+    long_twice = '{"a": 1, "pad": "%s", "a": 2, "z": 0}' % ('x' * SCAN_MIN)
+    assert [r for b in extract_ndjson([twice, long_twice], ['a', 'z']) for r in b] == [(1, 0), (1, 0)]
+    assert [r for b in extract_ndjson([twice, doc], ['a', 'z']) for r in b] == [(1, 0), (10, None)]
+    # cached values are copies
+    load_json_key(twice, 'b').append(99)
+    assert load_json_key(twice, 'b') == [2]
+    rows = [json.dumps({'id': i, 'name': 'n%d' % i, 'tags': ['x'] * (i % 3)}) for i in range(2500)]
+    batches = list(extract_ndjson(rows + [''], ['id', 'tags', 'missing'], batch_size=1000))
+    assert [len(b) for b in batches] == [1000, 1000, 500]
+    assert batches[2][-1] == (2499, [], None) and batches[0][1] == (1, ['x'], None)
+    print('Done')
+
+    def timed(f, *args, repeat=1):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            result = f(*args)
+        return result, (time.perf_counter() - t0) / repeat
+
+    payload = {'id': 1, 'status': 'ok'}
+    payload.update(('field%d' % i, {'values': [random.random() for _ in range(20)], 'label': 'x' * 20})
+                   for i in range(10_000))
+    payload['last'] = 'end'
+    data = json.dumps(payload)
+    print('document: %.1f MB' % (len(data) / 2**20))
+    for key in ('status', 'last', 'missing'):
+        expected, t_loads = timed(json_load_json_key, data, key, repeat=5)
+        result, t_scan = timed(load_json_key, data, key, 10, None, repeat=5)
+        _cache.clear()
+        load_json_key(data, key)
+        result, t_cached = timed(load_json_key, data, key, repeat=5)
+        assert result == expected
+        print('key %-7s json.loads %6.1f ms, scan_keys %6.2f ms (%.2fx), cached %.2f ms'
+              % (key, 1000 * t_loads, 1000 * t_scan, t_scan / t_loads, 1000 * t_cached))
+
+    for size in (5, 100):
+        lines = [json.dumps({'ts': i, 'level': 'info', 'user': i % 1000,
+                             'payload': {'items': list(range(size)), 'text': 'lorem ipsum ' * size}})
+                 for i in range(50_000)]
+        t_loads = t_ndjson = float('inf')
+        for _ in range(3):
+            expected, t = timed(lambda: [(d.get('ts'), d.get('user')) for d in map(json.loads, lines)])
+            t_loads = min(t_loads, t)
+            result, t = timed(lambda: [r for b in extract_ndjson(lines, ['ts', 'user']) for r in b])
+            t_ndjson = min(t_ndjson, t)
+        assert result == expected
+        print('%d ndjson lines of %d chars: json.loads %.0f ms, extract_ndjson %.0f ms (%.2fx)'
+              % (len(lines), len(lines[0]), 1000 * t_loads, 1000 * t_ndjson, t_ndjson / t_loads))
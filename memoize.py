@@ -0,0 +1,267 @@
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+# The memoize decorator from the Memoization notebook:
+#
+#     def memoize(fnc):
+#         cache = {}
+#         def inner(*args):
+#             if args in cache:
+#                 return cache[args]
+#             cache[args] = fnc(*args)
+#             return cache[args]
+#         return inner
+#
+# The cache never forgets anything, so in a long running process it grows
+# without limit. Two threads asking for the same key both compute it.
+#
+# memoize(...) below keeps at most `maxsize` entries and/or roughly `maxbytes`
+# bytes (sys.getsizeof of key and value) and evicts by one of three policies:
+#   'lru' - drop the least recently used entry
+#   'lfu' - drop the least frequently used entry (oldest first among equals)
+#   'ttl' - entries expire `ttl` seconds after they were stored; when the cache
+#           is full the oldest entry goes first
+# Keyword arguments are part of the key. A lock guards the cache, and threads
+# asking for a key that is being computed wait for that result instead of
+# computing it again. cache_info() returns hit/miss/eviction counts.
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses evictions currsize currbytes')
+
+_MISSING = object()
+_KWD_MARK = object()
+
+
+class _LRU:
+    def __init__(self):
+        self.data = OrderedDict()
+
+    def get(self, key):
+        value = self.data.get(key, _MISSING)
+        if value is not _MISSING:
+            self.data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+
+    def evict(self):
+        return self.data.popitem(last=False)
+
+
+class _TTL:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.data = OrderedDict()  # key -> (expires, value), oldest first
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return _MISSING
+        return entry[1]
+
+    def put(self, key, value):
+        self.data[key] = (time.monotonic() + self.ttl, value)
+
+    def expired(self):
+        # the entries are in expiry order, so only the oldest needs a look
+        oldest = next(iter(self.data.values()), None)
+        return oldest is not None and oldest[0] < time.monotonic()
+
+    def evict(self):
+        key, (_, value) = self.data.popitem(last=False)
+        return key, value
+
+
+class _LFU:
+    def __init__(self):
+        self.data = {}    # key -> [value, count]
+        self.counts = {}  # count -> OrderedDict of the keys used that many times
+        self.min_count = 0
+
+    def _touch(self, key, entry):
+        keys = self.counts[entry[1]]
+        del keys[key]
+        if not keys:
+            del self.counts[entry[1]]
+            if self.min_count == entry[1]:
+                self.min_count += 1
+        entry[1] += 1
+        self.counts.setdefault(entry[1], OrderedDict())[key] = None
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return _MISSING
+        self._touch(key, entry)
+        return entry[0]
+
+    def put(self, key, value):
+        self.data[key] = [value, 1]
+        self.counts.setdefault(1, OrderedDict())[key] = None
+        self.min_count = 1
+
+    def evict(self):
+        keys = self.counts[self.min_count]
+        key, _ = keys.popitem(last=False)
+        if not keys:
+            del self.counts[self.min_count]
+            self.min_count = min(self.counts, default=0)
+        return key, self.data.pop(key)[0]
+
+
+class _Call:
+    # a computation in progress that other threads can wait for
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def _make_key(args, kwargs):
+    if not kwargs:
+        return args
+    return args + (_KWD_MARK,) + tuple(sorted(kwargs.items()))
+
+def _sizeof(key, value):
+    return sys.getsizeof(key) + sys.getsizeof(value)
+
+def memoize(maxsize=128, maxbytes=None, policy='lru', ttl=None):
+    if policy == 'lru':
+        make_store = _LRU
+    elif policy == 'lfu':
+        make_store = _LFU
+    elif policy == 'ttl':
+        if ttl is None:
+            raise ValueError('policy ttl needs a ttl in seconds')
+        make_store = lambda: _TTL(ttl)
+    else:
+        raise ValueError('unknown policy %r' % policy)
+
+    def decorator(fnc):
+        store = make_store()
+        sizes = {}
+        lock = threading.Lock()
+        calls = {}
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0}
+
+        def evict():
+            key, _ = store.evict()
+            stats['bytes'] -= sizes.pop(key)
+            stats['evictions'] += 1
+
+        def full(size):
+            return ((maxsize is not None and len(sizes) + 1 > maxsize)
+                    or (maxbytes is not None and stats['bytes'] + size > maxbytes))
+
+        def store_value(key, value):
+            size = _sizeof(key, value) if maxbytes is not None else 0
+            if maxsize == 0 or (maxbytes is not None and size > maxbytes):
+                return
+            # make room first, so that a new LFU entry isn't the first victim
+            while sizes and full(size):
+                evict()
+            sizes[key] = size
+            stats['bytes'] += size
+            store.put(key, value)
+
+        @wraps(fnc)
+        def inner(*args, **kwargs):
+            key = _make_key(args, kwargs)
+            with lock:
+                value = store.get(key)
+                if value is not _MISSING:
+                    stats['hits'] += 1
+                    return value
+                call = calls.get(key)
+                owner = call is None
+                if owner:
+                    call = calls[key] = _Call()
+                    stats['misses'] += 1
+                    if policy == 'ttl':
+                        # this drops an expired entry for key as well
+                        while store.expired():
+                            evict()
+                else:
+                    stats['hits'] += 1
+            if not owner:
+                call.done.wait()
+                if call.error is not None:
+                    raise call.error
+                return call.value
+            try:
+                call.value = fnc(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+                raise
+            else:
+                with lock:
+                    store_value(key, call.value)
+                return call.value
+            finally:
+                with lock:
+                    del calls[key]
+                call.done.set()
+
+        def cache_info():
+            with lock:
+                return CacheInfo(stats['hits'], stats['misses'], stats['evictions'],
+                                 len(sizes), stats['bytes'])
+
+        def cache_clear():
+            nonlocal store
+            with lock:
+                store = make_store()
+                sizes.clear()
+                stats.update(hits=0, misses=0, evictions=0, bytes=0)
+
+        inner.cache_info = cache_info
+        inner.cache_clear = cache_clear
+        return inner
+    return decorator
+
+
+@memoize(maxsize=1000)
+def memoized_prime(n):
+
+    for i in range(n, 0, -1):
+        if all([i // x != i / x for x in range(i-1, 1, -1)]):
+            return i
+
+
+if __name__ == '__main__':
+    print(memoized_prime(10000))
+    print(memoized_prime(10000))
+    print(memoized_prime.cache_info())
+
+    # concurrent calls for the same key compute it once
+    from concurrent.futures import ThreadPoolExecutor
+    memoized_prime.cache_clear()
+    with ThreadPoolExecutor(8) as pool:
+        print(list(pool.map(memoized_prime, [20000] * 8)))
+    print(memoized_prime.cache_info())
+
+    for policy in ('lru', 'lfu'):
+        @memoize(maxsize=2, policy=policy)
+        def square(x):
+            return x * x
+        for x in (1, 1, 2, 2, 3, 1):
+            square(x)
+        print(policy, square.cache_info())
+
+    @memoize(maxsize=None, policy='ttl', ttl=0.05)
+    def now(x):
+        return time.monotonic()
+    first = now(1)
+    assert now(1) == first
+    time.sleep(0.06)
+    assert now(1) != first
+
+    @memoize(maxsize=None, maxbytes=10_000)
+    def blob(n, fill=b'x'):
+        return fill * n
+    for n in range(100):
+        blob(n * 10, fill=b'y')
+    print('bytes', blob.cache_info())
@@ -0,0 +1,144 @@
+import mmap
+import os
+import struct
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from mmap_index import delimiter_set, index_range, open_map
+from parallel_pipeline import process_context
+
+# index_mmap scans a file on one core, and every run scans it again.
+# build_index splits the file into one byte range per worker, each range
+# ending right after a newline, and indexes the ranges in worker processes.
+# Workers report absolute file offsets, so the per-range arrays only need to
+# be concatenated in range order to give one sorted index.
+#
+# index() keeps the result next to the file in a sidecar, <file>.offsets:
+# a fixed header (file size, mtime, delimiters) followed by the raw int64
+# offsets. Later runs memory map the sidecar and get the offsets back without
+# reading or parsing anything; index() returns a memoryview of int64 either
+# way. The header holds the size and mtime the file had before the build
+# started, so a file that changes while it is indexed is indexed again on the
+# next run. When the size or mtime no longer match the header, the index is
+# rebuilt.
+
+_MAGIC = b'OFFIDX1\0'
+_HEADER = struct.Struct('<8sqqq?B256s6x')
+
+
+def split_ranges(mm, parts):
+    size = len(mm)
+    bounds = [0]
+    for i in range(1, parts):
+        cut = mm.find(b'\n', max(size * i // parts, bounds[-1]))
+        if cut < 0:
+            break
+        if cut + 1 < size:
+            bounds.append(cut + 1)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+def _index_part(path, lo, hi, delims):
+    mm = open_map(path)
+    try:
+        return b''.join(block.tobytes() for block in index_range(mm, lo, hi, delims))
+    finally:
+        mm.close()
+
+def build_index(path, workers=None, delimiters=b' ', line_starts=True):
+    offsets = array('q')
+    mm = open_map(path)
+    if mm is None:
+        return offsets
+    delims = delimiter_set(delimiters, line_starts)
+    try:
+        size = len(mm)
+        drop_end = line_starts and mm[size - 1] == ord('\n') and ord('\n') not in delimiters
+        ranges = split_ranges(mm, workers or os.cpu_count() or 1)
+    finally:
+        mm.close()
+    if line_starts:
+        offsets.append(0)
+    with ProcessPoolExecutor(len(ranges), mp_context=process_context()) as pool:
+        futures = [pool.submit(_index_part, path, lo, hi, delims) for lo, hi in ranges]
+        for future in futures:
+            offsets.frombytes(future.result())
+    if drop_end and offsets and offsets[-1] == size:
+        offsets.pop()
+    return offsets
+
+
+def sidecar_path(path):
+    return path + '.offsets'
+
+def _header(st, delimiters, line_starts, count):
+    return _HEADER.pack(_MAGIC, st.st_size, st.st_mtime_ns, count,
+                        line_starts, len(delimiters), delimiters)
+
+def save_index(path, offsets, delimiters=b' ', line_starts=True, stat=None):
+    # stat is the os.stat() of the file the offsets were built from
+    stat = stat or os.stat(path)
+    tmp = sidecar_path(path) + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_header(stat, delimiters, line_starts, len(offsets)))
+        f.write(offsets.tobytes())
+    os.replace(tmp, sidecar_path(path))
+
+def load_index(path, delimiters=b' ', line_starts=True):
+    # the offsets of a still valid sidecar as a memoryview, or None
+    try:
+        f = open(sidecar_path(path), 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return None
+        count = _HEADER.unpack(header)[3]
+        if header != _header(os.stat(path), delimiters, line_starts, count):
+            return None
+        if count == 0:
+            return memoryview(array('q'))
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mm)[_HEADER.size:_HEADER.size + 8 * count].cast('q')
+
+def index(path, workers=None, delimiters=b' ', line_starts=True):
+    offsets = load_index(path, delimiters, line_starts)
+    if offsets is None:
+        stat = os.stat(path)
+        offsets = build_index(path, workers, delimiters, line_starts)
+        save_index(path, offsets, delimiters, line_starts, stat)
+        offsets = memoryview(offsets)
+    return offsets
+
+
+if __name__ == '__main__':
+    import random
+    import tempfile
+    import time
+    from mmap_index import index_mmap
+
+    words = ['four', 'score', 'and', 'seven', 'years', 'ago']
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        for _ in range(200_000):
+            f.write(' '.join(random.choices(words, k=random.randint(1, 12))) + '\n')
+        path = f.name
+
+    expected = [x for block in index_mmap(path) for x in block]
+    for run in ('build', 'reopen'):
+        t0 = time.perf_counter()
+        offsets = index(path, workers=4)
+        print('%s: %.1f ms, %d offsets' % (run, 1000 * (time.perf_counter() - t0), len(offsets)))
+        assert type(offsets) is memoryview and offsets.format == 'q' and list(offsets) == expected
+    with open(path, 'a') as f:
+        f.write('one more line\n')
+    assert len(index(path)) == len(expected) + 3
+    # a file written to during the build is stale, not saved as current
+    before = os.stat(path)
+    with open(path, 'a') as f:
+        f.write('written while indexing\n')
+    os.utime(path, ns=(before.st_atime_ns, before.st_mtime_ns + 1))
+    save_index(path, build_index(path), stat=before)
+    assert load_index(path) is None and len(index(path)) == len(expected) + 6
+    os.remove(sidecar_path(path))
+    os.remove(path)
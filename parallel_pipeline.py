@@ -0,0 +1,94 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from pipeline import compiled_pipe
+
+# The stages of a pipe are pure functions, so every input can be transformed
+# on any core. parallel_pipe cuts the input stream into chunks, ships each chunk
+# to a worker process and yields the transformed values.
+#
+# - Only the chunks travel between processes. The pipeline itself is handed to
+#   each worker once, when the worker starts. With the 'fork' start method it is
+#   inherited and never pickled, so lambdas and closures like add(50) work.
+#   On platforms without fork the stages have to be picklable.
+# - At most `window` chunks are in flight at any time. The input is read lazily
+#   and results are handed out as they arrive, so memory stays flat no matter
+#   how long the stream is.
+# - ordered=True yields the results in input order, ordered=False yields each
+#   chunk as soon as it completes.
+
+_worker_pipe = None
+
+def _init_worker(fns):
+    global _worker_pipe
+    _worker_pipe = compiled_pipe(fns)
+
+def _run_chunk(chunk):
+    return list(map(_worker_pipe, chunk))
+
+def _chunks(iterable, chunksize):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+def process_context():
+    # the multiprocessing context for worker pools, 'fork' where there is one
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+def parallel_pipe(fns, iterable, workers=None, chunksize=256, window=None, ordered=True):
+    workers = workers or os.cpu_count() or 1
+    window = window or 2 * workers
+    chunks = _chunks(iterable, chunksize)
+    with ProcessPoolExecutor(workers, mp_context=process_context(),
+                             initializer=_init_worker, initargs=(list(fns),)) as pool:
+        if ordered:
+            pending = deque(pool.submit(_run_chunk, c) for c in islice(chunks, window))
+            while pending:
+                done = pending.popleft().result()
+                for c in islice(chunks, 1):
+                    pending.append(pool.submit(_run_chunk, c))
+                yield from done
+        else:
+            pending = {pool.submit(_run_chunk, c) for c in islice(chunks, window)}
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for c in islice(chunks, len(finished)):
+                    pending.add(pool.submit(_run_chunk, c))
+                for future in finished:
+                    yield from future.result()
+
+
+def busy(x):
+    # a CPU-bound stage: naive trial division like the prime examples
+    return sum(1 for i in range(2, 300) if x % i == 0)
+
+def benchmark(n=20_000, chunksize=500):
+    import time
+    fns = [busy, lambda d: d * 2]
+    expected = list(map(compiled_pipe(fns), range(n)))
+    base = None
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        t0 = time.perf_counter()
+        result = list(parallel_pipe(fns, range(n), workers=workers, chunksize=chunksize))
+        elapsed = time.perf_counter() - t0
+        assert result == expected
+        base = base or elapsed
+        print('%2d worker(s): %.2f s (%.1fx)' % (workers, elapsed, base / elapsed))
+
+
+if __name__ == '__main__':
+    from functools import partial
+    from pipeline import mult, add, add_
+
+    print(list(parallel_pipe([mult, add(50), partial(add_, 100)], range(10), workers=2, chunksize=3)))
+    print(sorted(parallel_pipe([mult, add(50)], range(10), workers=2, chunksize=3, ordered=False)))
+
+    benchmark()
@@ -0,0 +1,127 @@
+from itertools import compress, count
+from math import isqrt
+
+# The notebooks find primes by trial division:
+#
+#     def prime(n):
+#         for i in range(n, 0, -1):
+#             if all([i // x != i / x for x in range(i-1, 1, -1)]):
+#                 return i
+#
+# Every candidate i is divided by every number below it (with float division)
+# and a full list is built before all() looks at it.
+#
+# This module answers the same questions from a sieve of Eratosthenes. The
+# sieve is a bytearray with flags[i] == 1 if i is prime, and crossing out
+# multiples of p is a single slice assignment: flags[start::p] = bytes(k).
+# The sieve is cached in the module and grows (at least doubling) when a
+# query goes past its end; the new part is sieved as a segment using the
+# primes already known. Queries above CACHE_LIMIT are answered from
+# temporary segments of SEGMENT numbers, so memory stays bounded.
+
+SEGMENT = 1 << 20
+CACHE_LIMIT = 1 << 26
+
+
+def _sieve_segment(lo, hi, base):
+    # flags for lo <= i < hi; base must hold the flags up to isqrt(hi - 1)
+    seg = bytearray(b'\x01') * (hi - lo)
+    for p in compress(range(isqrt(hi - 1) + 1), base):
+        start = max(p * p, (lo + p - 1) // p * p)
+        if start < hi:
+            seg[start - lo::p] = bytes(len(range(start, hi, p)))
+    for i in range(lo, min(hi, 2)):
+        seg[i - lo] = 0
+    return seg
+
+
+class _Sieve:
+    def __init__(self):
+        self.flags = bytearray(b'\x00\x00\x01\x01')
+
+    def extend(self, n):
+        # make sure the flags cover 0 <= i < n
+        if n <= len(self.flags):
+            return
+        n = max(n, 2 * len(self.flags))
+        self.extend(isqrt(n - 1) + 1)
+        self.flags += _sieve_segment(len(self.flags), n, self.flags)
+
+    def base(self, hi):
+        # flags covering every possible factor of the numbers below hi
+        self.extend(isqrt(hi - 1) + 1)
+        return self.flags
+
+_sieve = _Sieve()
+
+
+def segmented_sieve(lo, hi):
+    if hi <= lo:
+        return bytearray()
+    if hi <= CACHE_LIMIT:
+        _sieve.extend(hi)
+        return _sieve.flags[lo:hi]
+    return _sieve_segment(lo, hi, _sieve.base(hi))
+
+def is_prime(n):
+    return n >= 2 and segmented_sieve(n, n + 1)[0] == 1
+
+def primes():
+    # an endless generator of primes, one segment at a time
+    for lo in count(0, SEGMENT):
+        yield from compress(range(lo, lo + SEGMENT), segmented_sieve(lo, lo + SEGMENT))
+
+def primes_in_range(a, b):
+    # all primes p with a <= p < b
+    a = max(a, 0)
+    result = []
+    for lo in range(a, b, SEGMENT):
+        hi = min(lo + SEGMENT, b)
+        result.extend(compress(range(lo, hi), segmented_sieve(lo, hi)))
+    return result
+
+def prime_below(n):
+    # the largest prime p < n, or None
+    hi = n
+    while hi > 2:
+        lo = max(hi - SEGMENT, 0)
+        i = segmented_sieve(lo, hi).rfind(1)
+        if i >= 0:
+            return lo + i
+        hi = lo
+    return None
+
+def prime(n):
+    # the largest prime p <= n, like the notebook's prime(n)
+    return prime_below(n + 1)
+
+
+if __name__ == '__main__':
+    import time
+
+    def trial_division(n):
+        for i in range(n, 0, -1):
+            if all([i // x != i / x for x in range(i-1, 1, -1)]):
+                return i
+
+    print('Starting test')
+    assert all(prime(n) == trial_division(n) for n in range(2, 500))
+    assert primes_in_range(0, 30) == [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+    assert primes_in_range(CACHE_LIMIT, CACHE_LIMIT + 100) == \
+        [p for p in range(CACHE_LIMIT, CACHE_LIMIT + 100) if is_prime(p)]
+    assert next(p for p in primes() if p > 1000) == 1009
+    assert prime_below(2) is None and prime_below(3) == 2
+    print('Done')
+
+    t0 = time.perf_counter()
+    trial_division(10_000)
+    t1 = time.perf_counter()
+    p = prime_below(10_000_000)
+    t2 = time.perf_counter()
+    q = prime_below(10_000_000)
+    t3 = time.perf_counter()
+    print('trial division prime(10_000): %.1f ms' % (1000 * (t1 - t0)))
+    print('prime_below(10_000_000) = %d: %.1f ms first, %.3f ms cached' % (p, 1000 * (t2 - t1), 1000 * (t3 - t2)))
+    t0 = time.perf_counter()
+    big = prime_below(10 ** 12)
+    print('prime_below(10 ** 12) = %d: %.1f ms' % (big, 1000 * (time.perf_counter() - t0)))
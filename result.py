@@ -0,0 +1,223 @@
+from pipeline import compiled_pipe
+
+# safe.safe, exceptions.maybe and monad.maybe all look like this:
+#
+#     def safe(f):
+#         def inner(*args):
+#             for a in args:
+#                 if isinstance(a, Exception):
+#                     return a
+#             try:
+#                 return f(*args)
+#             except Exception as e:
+#                 return e
+#         return inner
+#
+# Every call scans its arguments with isinstance, and a failure hands back the
+# live exception. Its __traceback__ keeps every frame between the raise and
+# the except alive, with all their local variables, for as long as the caller
+# keeps the error around.
+#
+# Here success and failure are two small slotted classes instead:
+#   Ok(value)  - map(f) and bind(f) apply f to the value
+#   Err(error) - map and bind return the Err unchanged, so the first error
+#                short-circuits the rest of a chain
+# No argument is ever inspected: a chain is ok.bind(f).bind(g), not g(f(x)).
+# capture(f) turns a function that raises into one that returns Ok/Err. The
+# traceback is dropped from the captured exception, and from the exceptions
+# in its __cause__/__context__ chain, unless keep_traceback=True.
+# pipe(fns) runs a whole pipeline.compiled_pipe under one try, and map_all
+# maps a function over a batch under one try, stopping at the first error.
+# Ok.pipe takes such a pipe, or a plain list of stages, which it runs in a
+# loop under one try; nothing is compiled or cached per call, so any stages,
+# hashable or not, work. keep_traceback belongs to pipe() when a pipe is
+# given, and passing it to Ok.pipe as well raises TypeError.
+
+
+class Ok:
+    __slots__ = ('value',)
+    ok = True
+
+    def __init__(self, value):
+        self.value = value
+
+    def map(self, f):
+        return Ok(f(self.value))
+
+    def bind(self, f):
+        return f(self.value)
+
+    def pipe(self, fns, keep_traceback=None):
+        # fns is a pipe() or a list of stages
+        if callable(fns):
+            if keep_traceback is not None:
+                raise TypeError('keep_traceback is set by pipe(), not by Ok.pipe of a pipe')
+            return fns(self.value)
+        x = self.value
+        try:
+            for f in fns:
+                x = f(x)
+        except Exception as e:
+            return Err(e if keep_traceback else _strip(e))
+        return Ok(x)
+
+    def unwrap(self):
+        return self.value
+
+    def __eq__(self, other):
+        return type(other) is Ok and other.value == self.value
+
+    def __repr__(self):
+        return 'Ok(%r)' % (self.value,)
+
+
+class Err:
+    __slots__ = ('error',)
+    ok = False
+
+    def __init__(self, error):
+        self.error = error
+
+    def map(self, f):
+        return self
+
+    def bind(self, f):
+        return self
+
+    def pipe(self, fns, keep_traceback=None):
+        return self
+
+    def unwrap(self):
+        raise self.error
+
+    def __eq__(self, other):
+        return type(other) is Err and other.error == self.error
+
+    def __repr__(self):
+        return 'Err(%r)' % (self.error,)
+
+
+def _strip(error):
+    # drop the tracebacks of error and of every exception chained to it
+    error.__traceback__ = None
+    if error.__cause__ is None and error.__context__ is None:
+        return error
+    pending, seen = [error], set()
+    while pending:
+        e = pending.pop()
+        if e is None or id(e) in seen:
+            continue
+        seen.add(id(e))
+        e.__traceback__ = None
+        pending += e.__cause__, e.__context__
+    return error
+
+def capture(f, keep_traceback=False):
+    def inner(*args, **kwargs):
+        try:
+            return Ok(f(*args, **kwargs))
+        except Exception as e:
+            return Err(e if keep_traceback else _strip(e))
+    return inner
+
+def pipe(fns, keep_traceback=False):
+    return capture(compiled_pipe(fns), keep_traceback)
+
+def map_all(f, xs, keep_traceback=False):
+    # Ok([f(x) for x in xs]) or the Err of the first x that fails
+    try:
+        return Ok([f(x) for x in xs])
+    except Exception as e:
+        return Err(e if keep_traceback else _strip(e))
+
+def collect(results):
+    # Ok of all values, or the first Err; stops reading at the first Err
+    values = []
+    for r in results:
+        if not r.ok:
+            return r
+        values.append(r.value)
+    return Ok(values)
+
+
+def benchmark(n=200_000):
+    import timeit
+    import tracemalloc
+
+    def safe(f):
+        def inner(*args):
+            for a in args:
+                if isinstance(a, Exception):
+                    return a
+            try:
+                return f(*args)
+            except Exception as e:
+                return e
+        return inner
+
+    def divide(x, y):
+        return x / y
+
+    stages = [lambda x: x * 2, lambda x: x + 1]
+    compiled = pipe(stages)
+    for name, f in (('Ok.pipe(list)', lambda: Ok(10).pipe(stages)), ('Ok.pipe(pipe)', lambda: Ok(10).pipe(compiled))):
+        best = min(timeit.repeat(f, number=n, repeat=3))
+        print('%-14s %.0f ns/call' % (name, best / n * 1e9))
+
+    safe_divide, captured_divide = safe(divide), capture(divide)
+    for case, y in (('success', 2), ('failure', 0)):
+        for name, f in (('safe', safe_divide), ('capture', captured_divide)):
+            best = min(timeit.repeat(lambda: f(10, y), number=n, repeat=3))
+            print('%-8s %-8s %.0f ns/call' % (name, case, best / n * 1e9))
+
+    # what a thousand kept errors cost, when they were raised three frames deep
+    def deep(x, depth=3):
+        padding = list(range(1000))
+        return divide(x, 0) if depth == 0 else deep(x, depth - 1)
+
+    for name, f in (('safe', safe(deep)), ('capture', capture(deep)),
+                    ('capture, keep_traceback', capture(deep, keep_traceback=True))):
+        tracemalloc.start()
+        kept = [f(i) for i in range(1000)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('%-24s %.1f KB per kept error' % (name, size / len(kept) / 1024))
+
+
+if __name__ == '__main__':
+    from functools import partial
+    from pipeline import mult, add, add_
+
+    divide = capture(lambda x, y: x / y)
+    print(divide(20, 0), divide(20, 2))
+    print(Ok(20).bind(partial(divide, 100)).map(mult))
+    print(Ok(0).bind(partial(divide, 100)).map(mult))
+    print(Ok(50).pipe([mult, add(50), partial(add_, 100)]))
+    print(pipe([mult, lambda x: 1 / x])(0))
+    stages = [mult, partial(add_, 100)]
+    assert Ok(1).pipe(stages) == Ok(1).pipe(pipe(stages)) == Ok(102)
+    # unhashable stages are fine, failures are values
+    class Stage(list):
+        def __call__(self, x):
+            return 1 / x
+    assert Ok(2).pipe([Stage()]) == Ok(0.5) and type(Ok(0).pipe([Stage()]).error) is ZeroDivisionError
+    assert Ok(0).pipe([Stage()], keep_traceback=True).error.__traceback__ is not None
+    try:
+        Ok(1).pipe(pipe(stages), keep_traceback=True)
+    except TypeError:
+        pass
+    else:
+        raise AssertionError('keep_traceback with a pipe')
+
+    def chained(x):
+        try:
+            return 1 / x
+        except ZeroDivisionError as e:
+            raise ValueError('bad x') from e
+    error = capture(chained)(0).error
+    assert error.__traceback__ is None and error.__cause__.__traceback__ is None
+    assert capture(chained, keep_traceback=True)(0).error.__cause__.__traceback__ is not None
+    print(map_all(lambda x: 10 / x, [1, 2, 5]), map_all(lambda x: 10 / x, [1, 0, 5]))
+    print(collect(map(partial(divide, 10), [1, 2, 0, 5])))
+
+    benchmark()
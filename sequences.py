@@ -0,0 +1,149 @@
+# The coroutines and recognize notebooks generate the sequences like this:
+#
+#     def fibonacci():
+#         yield 1
+#         yield 1
+#         l = [1, 1]
+#         while True:
+#             l.append(sum(l[-2:]))
+#             yield l[-1]
+#
+# Every step slices the list and calls sum(), and in the recognize version the
+# list keeps every term ever produced, so memory grows with the number of terms.
+# The generators below keep only the last two (three) terms in local variables.
+#
+# To get the n-th term there is no need to walk the whole sequence:
+# - Fibonacci uses fast doubling, F(2k) = F(k) * (2F(k+1) - F(k)) and
+#   F(2k+1) = F(k)^2 + F(k+1)^2, one step per bit of n.
+# - Tribonacci raises the 3x3 step matrix to the n-th power by squaring.
+# Both take O(log n) big-int multiplications.
+#
+# Terms are numbered like the notebook generators: fibonacci_nth(0) is the
+# first 1, tribonacci_nth(0) is the first 0. A negative term number raises
+# ValueError.
+
+
+def fibonacci():
+    a, b = 1, 1
+    while True:
+        yield a
+        a, b = b, a + b
+
+def tribonacci():
+    a, b, c = 0, 1, 1
+    while True:
+        yield a
+        a, b, c = b, c, a + b + c
+
+
+def _check(n):
+    if n < 0:
+        raise ValueError('Term numbers start at 0, got %d' % n)
+
+
+def _fibonacci_pair(n):
+    # (F(n), F(n+1)) with F(0) = 0, F(1) = 1
+    a, b = 0, 1
+    for bit in bin(n)[2:]:
+        c = a * (2 * b - a)
+        d = a * a + b * b
+        a, b = (d, c + d) if bit == '1' else (c, d)
+    return a, b
+
+def fibonacci_nth(n):
+    _check(n)
+    return _fibonacci_pair(n + 1)[0]
+
+def fibonacci_range(k, m):
+    # the terms k .. k+m-1
+    _check(k)
+    a, b = _fibonacci_pair(k + 1)
+    result = []
+    for _ in range(m):
+        result.append(a)
+        a, b = b, a + b
+    return result
+
+
+def _mat_mult(x, y):
+    return tuple(tuple(sum(x[i][k] * y[k][j] for k in range(3)) for j in range(3))
+                 for i in range(3))
+
+_TRIBONACCI_STEP = ((1, 1, 1), (1, 0, 0), (0, 1, 0))
+
+def _tribonacci_triple(n):
+    # (T(n), T(n+1), T(n+2)) with T(0) = 0, T(1) = T(2) = 1
+    result = ((1, 0, 0), (0, 1, 0), (0, 0, 1))
+    m = _TRIBONACCI_STEP
+    while n:
+        if n & 1:
+            result = _mat_mult(result, m)
+        m = _mat_mult(m, m)
+        n >>= 1
+    # result * (T(2), T(1), T(0)) = (T(n+2), T(n+1), T(n))
+    t2, t1, t0 = (row[0] + row[1] for row in result)
+    return t0, t1, t2
+
+def tribonacci_nth(n):
+    _check(n)
+    return _tribonacci_triple(n)[0]
+
+def tribonacci_range(k, m):
+    _check(k)
+    a, b, c = _tribonacci_triple(k)
+    result = []
+    for _ in range(m):
+        result.append(a)
+        a, b, c = b, c, a + b + c
+    return result
+
+
+if __name__ == '__main__':
+    import time
+    from itertools import islice
+
+    def notebook_fibonacci():
+        yield 1
+        yield 1
+        l = [1, 1]
+        while True:
+            l.append(sum(l[-2:]))
+            yield l[-1]
+
+    def notebook_tribonacci():
+        yield 0
+        yield 1
+        yield 1
+        l = [0, 1, 1]
+        while True:
+            l.append(sum(l[-3:]))
+            yield l[-1]
+
+    print('Starting test')
+    expected_f = list(islice(notebook_fibonacci(), 300))
+    expected_t = list(islice(notebook_tribonacci(), 300))
+    assert list(islice(fibonacci(), 300)) == expected_f
+    assert list(islice(tribonacci(), 300)) == expected_t
+    assert [fibonacci_nth(n) for n in range(300)] == expected_f
+    assert [tribonacci_nth(n) for n in range(300)] == expected_t
+    assert fibonacci_range(0, 0) == []
+    assert all(fibonacci_range(k, 20) == expected_f[k:k + 20] for k in range(280))
+    assert all(tribonacci_range(k, 20) == expected_t[k:k + 20] for k in range(280))
+    for f in (fibonacci_nth, tribonacci_nth, lambda k: fibonacci_range(k, 3), lambda k: tribonacci_range(k, 3)):
+        for n in (-1, -5):
+            try:
+                f(n)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(n)
+    print('Done')
+
+    n = 200_000
+    t0 = time.perf_counter()
+    walked = next(islice(notebook_fibonacci(), n, None))
+    t1 = time.perf_counter()
+    jumped = fibonacci_nth(n)
+    t2 = time.perf_counter()
+    assert walked == jumped
+    print('term %d: notebook generator %.1f ms, fast doubling %.1f ms' % (n, 1000 * (t1 - t0), 1000 * (t2 - t1)))
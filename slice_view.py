@@ -0,0 +1,220 @@
+from array import array
+from itertools import islice
+
+# slice-sequence.py: "The result of slicing a list is a whole new list". Every
+# a[i:j] allocates a new list and copies j - i references into it, bytes[i:j]
+# copies the bytes, and the windows of the sequence generators (l[-2:],
+# l[-3:]) are copied again for every number they produce.
+#
+# A SliceView is a window onto a sequence that copies nothing. It holds the
+# sequence and a range of its indices:
+# - view[k] reads base[indices[k]], view[k] = x writes base[indices[k]], so
+#   writes go through to the sequence
+# - view[i:j:k] slices the range, which gives another view onto the same
+#   sequence, however deeply the views are nested
+# - len() and iteration work as for the sequence itself
+# Lists, arrays and other sequences are indexed directly. bytes, bytearray,
+# mmap and other buffers are indexed through a memoryview, and buffer() gives
+# the window as a memoryview for C-level work such as hashing or writing.
+# A view does not follow its sequence when it grows or shrinks: the indices
+# are fixed when the view is made.
+#
+# windows(seq, size, step) yields the sliding windows of a sequence as views,
+# so each window costs one small object whatever its size.
+
+
+# sequences whose iterators can be moved to an index with __setstate__
+_POSITIONED = (list, tuple, str, array)
+
+
+def _as_base(seq):
+    if isinstance(seq, (list, tuple, range, str)):
+        return seq
+    try:
+        # arrays, bytes, bytearray, mmap, ...; a memoryview keeps its format
+        view = memoryview(seq)
+    except TypeError:
+        return seq
+    # arrays stay arrays, a memoryview would stop them from growing
+    return seq if hasattr(seq, 'typecode') else view
+
+def _slice(indices):
+    # the slice object that selects indices from the base sequence
+    stop = indices.stop if indices.stop >= 0 else None
+    return slice(indices.start, stop, indices.step)
+
+
+class SliceView:
+    __slots__ = ('base', 'indices')
+
+    def __init__(self, seq, start=None, stop=None, step=None):
+        if isinstance(seq, SliceView):
+            self.base = seq.base
+            self.indices = seq.indices[start:stop:step]
+        else:
+            self.base = _as_base(seq)
+            self.indices = range(len(self.base))[start:stop:step]
+
+    def _view(self, indices):
+        view = SliceView.__new__(SliceView)
+        view.base = self.base
+        view.indices = indices
+        return view
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._view(self.indices[key])
+        try:
+            return self.base[self.indices[key]]
+        except IndexError:
+            raise IndexError('SliceView index out of range') from None
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, slice):
+            try:
+                self.base[self.indices[key]] = value
+            except IndexError:
+                raise IndexError('SliceView assignment index out of range') from None
+            return
+        # a view cannot change the length of its sequence
+        indices = self.indices[key]
+        if not hasattr(value, '__len__'):
+            value = list(value)
+        if len(value) != len(indices):
+            raise ValueError('Cannot assign %d items to a SliceView of %d' % (len(value), len(indices)))
+        if isinstance(self.base, memoryview) and not isinstance(value, (bytes, bytearray, memoryview)):
+            for i, v in zip(indices, value):
+                self.base[i] = v
+        else:
+            self.base[_slice(indices)] = value
+
+    def __iter__(self):
+        # never walks the base from index 0, so the cost does not grow with start
+        indices, base = self.indices, self.base
+        if indices.step == 1 and type(base) in _POSITIONED:
+            # the base's own iterator, moved to start
+            it = iter(base)
+            it.__setstate__(indices.start)
+            return islice(it, len(indices))
+        if type(base) is memoryview:
+            return iter(base[_slice(indices)])
+        return map(base.__getitem__, indices)
+
+    def __reversed__(self):
+        return map(self.base.__getitem__, reversed(self.indices))
+
+    def __eq__(self, other):
+        try:
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return 'SliceView(%r)' % (self.copy(),)
+
+    def copy(self):
+        # the window as a sequence of the base's own type (a copy)
+        if isinstance(self.base, memoryview):
+            return self.buffer().tobytes() if self.base.format in 'Bbc' else self.buffer().tolist()
+        return self.base[_slice(self.indices)]
+
+    def buffer(self):
+        # the window as a memoryview, only for buffers and arrays
+        base = self.base if type(self.base) is memoryview else memoryview(self.base)
+        return base[_slice(self.indices)]
+
+
+def windows(seq, size, step=1):
+    # sliding windows of size items, step items apart
+    view = seq if isinstance(seq, SliceView) else SliceView(seq)
+    for start in range(0, len(view) - size + 1, step):
+        yield view[start:start + size]
+
+def tail(seq, n):
+    # the last n items, e.g. tail(l, 3) instead of l[-3:]
+    return SliceView(seq, -n)
+
+
+if __name__ == '__main__':
+    import time
+    import timeit
+    import tracemalloc
+
+    print('Starting test')
+    a = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+    v = SliceView(a, 4)
+    assert list(v) == a[4:] and len(v) == 4 and v[-1] == 'h'
+    v[1] = 99
+    assert a[5] == 99
+    nested = SliceView(a)[1:-1][::2][1:]
+    assert list(nested) == a[1:-1][::2][1:] and nested == a[1:-1][::2][1:]
+    assert list(SliceView(a)[::-1][2:5]) == a[::-1][2:5]
+    assert list(reversed(SliceView(a, 2, 6))) == a[2:6][::-1]
+    SliceView(a)[::-3] = ['x', 'y', 'z']
+    assert a[::-3] == ['x', 'y', 'z']
+
+    data = bytearray(b'0123456789')
+    w = SliceView(data)[2:8][::2]
+    assert w.copy() == b'246' and w[0] == ord('2')
+    w[:] = b'abc'
+    assert data == bytearray(b'01a3b5c789')
+    assert SliceView(b'hello world', 6).buffer() == b'world'
+    try:
+        w[:] = b'ab'
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('resizing assignment')
+
+    numbers = array('d', range(10))
+    SliceView(numbers, 5)[0] = -1.0
+    numbers.append(10.0)
+    assert numbers[5] == -1.0 and list(windows(numbers, 4, 3))[1].copy() == array('d', [3, 4, -1, 6])
+
+    # the notebook's tribonacci generator, with a view instead of l[-3:]
+    def tribonacci():
+        l = [0, 0, 1]
+        while True:
+            yield l[-3]
+            l.append(sum(tail(l, 3)))
+    t = tribonacci()
+    assert [next(t) for _ in range(10)] == [0, 0, 1, 1, 2, 4, 7, 13, 24, 44]
+    print('Done')
+
+    def measure(f):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        result = f()
+        elapsed = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, elapsed, peak
+
+    big = list(range(1_000_000))
+    # iterating a view costs its length, wherever it starts
+    near, far = min(timeit.repeat(lambda: sum(SliceView(big, 3, 6)), number=1000, repeat=5)), \
+        min(timeit.repeat(lambda: sum(tail(big, 3)), number=1000, repeat=5))
+    assert far < 10 * near, (near, far)
+    print('sum of 3 items at the start: %.2f us, at the end: %.2f us' % (1000 * near, 1000 * far))
+
+    size = 10_000
+    for name, f in (('list slices', lambda: sum(w[0] for w in (big[i:i + size] for i in range(0, len(big) - size + 1, 100)))),
+                    ('SliceView windows', lambda: sum(w[0] for w in windows(big, size, 100)))):
+        result, elapsed, peak = measure(f)
+        print('%-18s windows of %d: %.0f ms, peak %.0f KB' % (name, size, 1000 * elapsed, peak / 1024))
+    # iterating every item of every window, not just its first one
+    for name, f in (('list slices', lambda: sum(sum(big[i:i + size]) for i in range(0, len(big), size))),
+                    ('SliceView windows', lambda: sum(map(sum, windows(big, size, size))))):
+        result, elapsed, peak = measure(f)
+        print('%-18s summed windows of %d: %.0f ms, peak %.0f KB' % (name, size, 1000 * elapsed, peak / 1024))
+
+    blob = bytes(50_000_000)
+    records = 2000
+    length = len(blob) // records
+    for name, f in (('bytes slices', lambda: sum(len(blob[i * length:(i + 1) * length]) for i in range(records))),
+                    ('SliceView', lambda: sum(len(w.buffer()) for w in windows(blob, length, length)))):
+        result, elapsed, peak = measure(f)
+        print('%-18s %d records of %d bytes: %.0f ms, peak %.0f KB' % (name, records, length, 1000 * elapsed, peak / 1024))
@@ -0,0 +1,166 @@
+from functools import partial, wraps
+
+# Recursion is the natural way to write many functional definitions:
+#
+#     def f_factorial(n):
+#         return 1 if n == 0 else n*f_factorial(n-1)
+#
+# but every call costs a Python frame, and f_factorial(1000) already dies
+# with RecursionError. Python has no tail-call optimization, so the two
+# decorators below run recursive definitions as loops instead.
+#
+# trampoline - for tail recursion. Instead of calling itself the function
+#     returns fn.call(args), a Call object holding the function and its
+#     arguments. The decorator keeps calling until a value that is not a Call
+#     comes back. Calls to other trampolined functions (mutual recursion)
+#     work the same way.
+#
+# recursive - for any recursion. The function becomes a generator that
+#     yields fn.call(args) where it would recurse and receives the result back
+#     from the yield. The decorator keeps the pending generators on an explicit
+#     list instead of the interpreter stack:
+#
+#         @recursive
+#         def factorial(n):
+#             return 1 if n == 0 else n * (yield factorial.call(n - 1))
+#
+#     An exception that escapes a call is thrown into the generator that
+#     yielded it, so try/except around the yield works as around a call.
+
+
+# Call is a functools.partial under its own name: creating and calling one
+# happens in C, so a step costs no extra Python frame. The separate type keeps
+# ordinary partials (e.g. from curry) returned by a function from being called.
+class Call(partial):
+    __slots__ = ()
+
+
+def trampoline(fnc):
+    @wraps(fnc)
+    def inner(*args, **kwargs):
+        result = fnc(*args, **kwargs)
+        while type(result) is Call:
+            result = result()
+        return result
+    inner.call = partial(Call, fnc)
+    return inner
+
+def recursive(fnc):
+    @wraps(fnc)
+    def inner(*args, **kwargs):
+        stack = [fnc(*args, **kwargs)]
+        value = error = None
+        while stack:
+            try:
+                if error is None:
+                    request = stack[-1].send(value)
+                else:
+                    thrown, error = error, None
+                    request = stack[-1].throw(thrown)
+            except StopIteration as e:
+                stack.pop()
+                value = e.value
+            except BaseException as e:
+                # raised out of the yield in the caller, as a real call would
+                stack.pop()
+                if not stack:
+                    raise
+                error = e
+            else:
+                stack.append(request())
+                value = None
+        return value
+    inner.call = partial(Call, fnc)
+    return inner
+
+
+def p_factorial(n):
+
+    f = 1
+    for i in range(1, n+1):
+        f *= i
+    return f
+
+def f_factorial(n):
+
+    return 1 if n == 0 else n*f_factorial(n-1)
+
+@trampoline
+def t_factorial(n, acc=1):
+    return acc if n == 0 else t_factorial.call(n - 1, acc * n)
+
+@recursive
+def r_factorial(n):
+    return 1 if n == 0 else n * (yield r_factorial.call(n - 1))
+
+# sums instead of products, so the numbers stay small and the time measured
+# is the cost of the recursion itself
+def p_sum(n):
+    s = 0
+    for i in range(1, n+1):
+        s += i
+    return s
+
+@trampoline
+def t_sum(n, acc=0):
+    return acc if n == 0 else t_sum.call(n - 1, acc + n)
+
+@recursive
+def r_sum(n):
+    return 0 if n == 0 else n + (yield r_sum.call(n - 1))
+
+@trampoline
+def is_even(n):
+    return True if n == 0 else is_odd.call(n - 1)
+
+@trampoline
+def is_odd(n):
+    return False if n == 0 else is_even.call(n - 1)
+
+
+def benchmark(n=10 ** 5):
+    import time
+    for group in ((p_factorial, t_factorial, r_factorial), (p_sum, t_sum, r_sum)):
+        expected = None
+        for f in group:
+            t0 = time.perf_counter()
+            result = f(n)
+            elapsed = time.perf_counter() - t0
+            assert expected is None or result == expected
+            expected = result
+            print('%-12s n=%d: %.1f ms' % (f.__name__, n, 1000 * elapsed))
+
+
+if __name__ == '__main__':
+    try:
+        f_factorial(10 ** 5)
+    except RecursionError as e:
+        print('f_factorial:', e)
+
+    print('Starting test')
+    assert [t_factorial(n) for n in range(20)] == [p_factorial(n) for n in range(20)]
+    assert [r_factorial(n) for n in range(20)] == [p_factorial(n) for n in range(20)]
+    assert is_even(10 ** 5) and is_odd(10 ** 5 + 1)
+    assert t_factorial(5, acc=2) == r_factorial(n=5) * 2 == 240
+
+    # an exception reaches the caller's yield, and leaves the outermost call
+    @recursive
+    def bottom(n, catch_at):
+        if n == 0:
+            raise ValueError('bottom')
+        try:
+            return (yield bottom.call(n - 1, catch_at))
+        except ValueError:
+            if n != catch_at:
+                raise
+            return n
+    assert bottom(10 ** 4, catch_at=3) == 3
+    try:
+        bottom(10, catch_at=None)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('ValueError swallowed')
+    print('Done')
+
+    benchmark()